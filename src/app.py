@@ -1,10 +1,10 @@
 import gradio as gr
 import os
 from constant import WIDTH, BLACK, WHITE, EMPTY, WIN_LEN
-from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH
+from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH, MCTS_TIME_BUDGET_MS
 
 from constant import ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
-from constant import HEURISTIC_CFG
+from constant import HEURISTIC_CFG, EVAL_STORE_PATH
 
 from mcts import MCTS
 from game import GameAction, GameState, Game
@@ -32,7 +32,8 @@ class GomokuGUI:
         state = self.game.get_state()
         player = state.next_player
         color = "黑" if player == BLACK else "白"
-        best_action, visit_rate_dict = self.agent.search(state)
+        best_action, visit_rate_dict, stats = self.agent.search(state, time_budget_ms=MCTS_TIME_BUDGET_MS)
+        print(stats)
         
         self.predict_result = best_action
         self.search_result = visit_rate_dict
@@ -214,7 +215,8 @@ if __name__ == "__main__":
         ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG, 
         ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON, 
         HEURISTIC_CFG,
-        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT,
+        eval_store_path=EVAL_STORE_PATH, reuse_search_results=True
     )
     agent = MCTS(mcts_cfg)
     
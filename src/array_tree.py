@@ -0,0 +1,240 @@
+from game import GameAction, GameState
+from bitboard import iter_bits
+from candidates import candidate_mask, near_mask
+from rollout import get_next_state
+
+from typing import List, Optional, Dict, Tuple
+
+import math
+import random
+
+import numpy as np
+
+
+class ArrayTree:
+    # MCTS tree as parallel arrays, one slot per node
+    # the children of a node are one contiguous block [first_child, first_child + child_count),
+    # allocated with all candidate moves on the first expansion and expanded in block order.
+    # Like MCTSNode, the block order is random and every expanded child has been visited,
+    # so UCT over a fully expanded node is one vectorized argmax
+    def __init__(self, root_state: GameState, capacity: int=4096, candidate_radius: int=0):
+        self.visit = np.zeros(capacity, dtype=np.int64)          # N
+        self.value_sum = np.zeros(capacity, dtype=np.float64)    # W
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.child_count = np.zeros(capacity, dtype=np.int16)
+        self.n_expanded = np.zeros(capacity, dtype=np.int16)
+        self.action = np.full(capacity, -1, dtype=np.int16)      # bit index of the move into the node
+        # GameState of expanded nodes, None for slots that are still unexpanded
+        self.states: List[Optional[GameState]] = [None] * capacity
+
+        self.root = 0
+        self.n_nodes = 1
+        self.states[0] = root_state
+        # see MCTSConfig.candidate_radius, the near mask is built from the stones once per allocated block
+        self.candidate_radius = candidate_radius
+
+
+    @property
+    def capacity(self) -> int:
+        return len(self.states)
+
+
+    def _ensure_capacity(self, n_nodes: int) -> None:
+        capacity = self.capacity
+        if n_nodes <= capacity:
+            return
+        new_capacity = max(2 * capacity, n_nodes)
+        for name, fill in [("visit", 0), ("value_sum", 0), ("parent", -1), ("first_child", -1), ("child_count", 0), ("n_expanded", 0), ("action", -1)]:
+            old = getattr(self, name)
+            new = np.full(new_capacity, fill, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        self.states.extend([None] * (new_capacity - capacity))
+
+
+    def move_mask(self, state: GameState) -> int:
+        if self.candidate_radius <= 0:
+            return state.legal_mask
+        return candidate_mask(state.legal_mask, near_mask(state.black | state.white, self.candidate_radius))
+
+
+    def _allocate_children(self, node: int) -> None:
+        actions = list(iter_bits(self.move_mask(self.states[node])))
+        # MCTSNode expands its shuffled list from the end
+        random.shuffle(actions)
+        actions.reverse()
+        first = self.n_nodes
+        count = len(actions)
+        self._ensure_capacity(first + count)
+        self.action[first:first + count] = actions
+        self.parent[first:first + count] = node
+        self.first_child[node] = first
+        self.child_count[node] = count
+        self.n_nodes = first + count
+
+
+    def select_and_expand(self, c_uct: float) -> int:
+        # selection down to a terminal node or a node with an unexpanded child, which is expanded
+        node = self.root
+        states = self.states
+        while True:
+            state = states[node]
+            if state.done:
+                return node
+            first = int(self.first_child[node])
+            if first < 0:
+                self._allocate_children(node)
+                first = int(self.first_child[node])
+            n_expanded = int(self.n_expanded[node])
+            if n_expanded < self.child_count[node]:
+                child = first + n_expanded
+                states[child] = get_next_state(state, GameAction.ALL_ACTIONS[self.action[child]])
+                self.n_expanded[node] = n_expanded + 1
+                return child
+            node = self.select_child(node, c_uct)
+
+
+    def select_child(self, node: int, c_uct: float) -> int:
+        # the UCT score of MCTSNode.select_child, for all children at once
+        first = int(self.first_child[node])
+        end = first + int(self.child_count[node])
+        visit = self.visit[first:end]
+        scores = -(self.value_sum[first:end] / visit) + c_uct * np.sqrt(2.0 * math.log(self.visit[node]) / visit)
+        best = np.flatnonzero(scores == scores.max())
+        # random.choice even for a single candidate, so the random stream matches MCTSNode
+        return first + int(random.choice(best))
+
+
+    def backup(self, node: int, value: float) -> None:
+        # iterative, following the parent index up to the root
+        visit, value_sum, parent = self.visit, self.value_sum, self.parent
+        root = self.root
+        while True:
+            visit[node] += 1
+            value_sum[node] += value
+            if node == root:
+                return
+            node = parent[node]
+            value = -value
+
+
+    def root_child(self, node: int) -> Optional[int]:
+        # the child of the root on the path to node
+        if node == self.root:
+            return None
+        while self.parent[node] != self.root:
+            node = self.parent[node]
+        return int(node)
+
+
+    def depth(self, node: int) -> int:
+        depth = 0
+        while node != self.root:
+            node = self.parent[node]
+            depth += 1
+        return depth
+
+
+    def root_visit_count(self) -> int:
+        return int(self.visit[self.root])
+
+
+    def get_visit_counts(self) -> Dict[GameAction, int]:
+        first = int(self.first_child[self.root])
+        if first < 0:
+            return {}
+        end = first + int(self.n_expanded[self.root])
+        return {GameAction.ALL_ACTIONS[int(self.action[child])]: int(self.visit[child]) for child in range(first, end)}
+
+
+    def get_visit_distribution(self) -> Dict[GameAction, float]:
+        visit_counts = self.get_visit_counts()
+        child_visit_count = sum(visit_counts.values())
+        if child_visit_count == 0:
+            return {}
+        return {action: n / child_visit_count for action, n in visit_counts.items()}
+
+
+    def find_descendant(self, state: GameState, max_depth: int) -> Optional[int]:
+        # breadth first down to max_depth plies below the root, matched by zobrist key first
+        level = [self.root]
+        for depth in range(max_depth + 1):
+            next_level = []
+            for node in level:
+                node_state = self.states[node]
+                if node_state.key == state.key and node_state == state:
+                    return node
+                first = int(self.first_child[node])
+                if depth < max_depth and first >= 0:
+                    next_level.extend(range(first, first + int(self.n_expanded[node])))
+            level = next_level
+        return None
+
+
+    def subtree(self, node: int) -> "ArrayTree":
+        # copy of the subtree below node, so the slots of the rest of the tree are released
+        tree = ArrayTree(self.states[node], max(4096, self.n_nodes), self.candidate_radius)
+        tree.visit[0] = self.visit[node]
+        tree.value_sum[0] = self.value_sum[node]
+        pending: List[Tuple[int, int]] = [(node, 0)]
+        while pending:
+            old, new = pending.pop()
+            first = int(self.first_child[old])
+            if first < 0:
+                continue
+            count = int(self.child_count[old])
+            n_expanded = int(self.n_expanded[old])
+            new_first = tree.n_nodes
+            tree.n_nodes += count
+            for name in ["visit", "value_sum", "action"]:
+                getattr(tree, name)[new_first:new_first + count] = getattr(self, name)[first:first + count]
+            tree.parent[new_first:new_first + count] = new
+            tree.states[new_first:new_first + count] = self.states[first:first + count]
+            tree.first_child[new] = new_first
+            tree.child_count[new] = count
+            tree.n_expanded[new] = n_expanded
+            pending.extend((first + k, new_first + k) for k in range(n_expanded))
+        return tree
+
+
+if __name__ == "__main__":
+    # differential check: with the same seed the array tree takes the same decisions as MCTSNode
+    from constant import MCTS_SELECT_UCT, MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+    from constant import ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
+    from constant import HEURISTIC_CFG
+    from mcts_config import MCTSConfig
+    from mcts import MCTS
+    from game import Game
+
+    def make_agent(tree_backend: str) -> MCTS:
+        return MCTS(MCTSConfig(
+            300, MCTS_SELECT_UCT,
+            ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG,
+            ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON,
+            HEURISTIC_CFG,
+            MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT,
+            transposition_table_size=0, tree_backend=tree_backend,
+            # the array tree expands every candidate in random order
+            widening_c=0.0, prior_weight=0.0
+        ))
+
+    agents = {backend: make_agent(backend) for backend in ["object", "array"]}
+    game = Game()
+    state = game.get_state()
+    n_checked = 0
+    while not state.done:
+        results = dict()
+        for backend, agent in agents.items():
+            random.seed(n_checked)
+            # the stats hold timings, only the move and the distribution must match
+            results[backend] = agent.search(state)[:2]
+        if results["object"] != results["array"]:
+            print(state)
+            raise AssertionError("array tree differs from object tree")
+        n_checked += 1
+        action = results["object"][0]
+        game.execute_action(action)
+        game.check(action)
+        state = game.get_state()
+    print(f"{n_checked} searches match")
@@ -0,0 +1,156 @@
+from constant import EMPTY, WIDTH, WIN_LEN
+from game import GameState
+from bitboard import CELL_COUNT
+from heuristic_numpy import NumpyHeuristic
+from candidates import CENTRE_BIT, neighbourhood_masks, near_mask
+
+from typing import List, Optional
+
+import random
+
+import numpy as np
+
+
+def _build_five_windows() -> np.ndarray:
+    # windows[c] lists the cells of every WIN_LEN line through cell c, padded with windows of the
+    # sentinel cell CELL_COUNT, which is always EMPTY
+    windows = []
+    for x in range(WIDTH):
+        for y in range(WIDTH):
+            cell_windows = []
+            for dx, dy in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                for offset in range(WIN_LEN):
+                    sx, sy = x - dx * offset, y - dy * offset
+                    ex, ey = sx + dx * (WIN_LEN - 1), sy + dy * (WIN_LEN - 1)
+                    if 0 <= sx < WIDTH and 0 <= sy < WIDTH and 0 <= ex < WIDTH and 0 <= ey < WIDTH:
+                        cell_windows.append([(sx + dx * i) * WIDTH + sy + dy * i for i in range(WIN_LEN)])
+            windows.append(cell_windows)
+    n_windows = max(len(cell_windows) for cell_windows in windows)
+    padded = [cell_windows + [[CELL_COUNT] * WIN_LEN] * (n_windows - len(cell_windows)) for cell_windows in windows]
+    return np.array(padded, dtype=np.int64)
+
+
+FIVE_WINDOWS: np.ndarray = _build_five_windows()
+
+
+def mask_to_array(mask: int) -> np.ndarray:
+    return np.array([(mask >> idx) & 1 for idx in range(CELL_COUNT)], dtype=bool)
+
+
+CENTRE: np.ndarray = mask_to_array(CENTRE_BIT)
+
+
+class BatchRollout:
+    # Rollout with all rollouts of one call played in lockstep on a (K, CELL_COUNT + 1) array,
+    # the last column being an always empty sentinel cell
+    def __init__(self, n_rollout: int, depth: int, heuristic: NumpyHeuristic, important_pos_weight: int, other_pos_weight: int, epsilon: float, candidate_radius: int=0):
+        self.n_rollout = n_rollout
+        self.depth = depth
+        self.heuristic = heuristic
+        self.important_pos_weight = important_pos_weight
+        self.other_pos_weight = other_pos_weight
+        self.epsilon = epsilon
+        # neighbourhoods[idx] as a (CELL_COUNT, CELL_COUNT) bool table, see Rollout.candidate_radius
+        self.candidate_radius = candidate_radius
+        self.neighbourhoods = np.array([mask_to_array(mask) for mask in neighbourhood_masks(candidate_radius)]) if candidate_radius > 0 else None
+        # same counters as Rollout
+        self.n_played = 0
+        self.n_plies = 0
+
+
+    def estimate_value(self, state: GameState) -> float:
+        # MCTS evaluates one leaf per simulation, so during a search the batch is the n_rollout rollouts of that leaf
+        return float(self.estimate_values([state])[0])
+
+
+    def estimate_values(self, states: List[GameState]) -> np.ndarray:
+        # n_rollout rollouts per state, all states in one batch; values from the view of each state's next_player
+        # scored like Rollout.estimate_value: with a heuristic a finished rollout is worth 0, without one the winner decides
+        n_rollout = self.n_rollout
+        k = len(states) * n_rollout
+        # numpy stream seeded from random, so random.seed still makes searches reproducible
+        rng = np.random.default_rng(random.getrandbits(64))
+
+        boards = np.zeros((k, CELL_COUNT + 1), dtype=np.int8)
+        boards[:, :CELL_COUNT] = np.repeat(np.array([np.ravel(state.board) for state in states], dtype=np.int8), n_rollout, axis=0)
+        root_players = np.repeat(np.array([state.next_player for state in states], dtype=np.int8), n_rollout)
+        players = root_players.copy()
+        done = np.repeat(np.array([state.done for state in states]), n_rollout)
+        winners = np.repeat(np.array([state.winner for state in states], dtype=np.int8), n_rollout)
+        rows = np.arange(k)
+        self.n_played += k
+        near = None
+        if self.neighbourhoods is not None:
+            near = np.repeat(np.array([mask_to_array(near_mask(state.black | state.white, self.candidate_radius)) for state in states]), n_rollout, axis=0)
+
+        for _ in range(self.depth):
+            active = np.flatnonzero(~done)
+            if len(active) == 0:
+                break
+            self.n_plies += len(active)
+            moves = self.choose_moves(boards[active], players[active], rng, near[active] if near is not None else None)
+            active_players = players[active]
+            boards[active, moves] = active_players
+            if near is not None:
+                near[active] |= self.neighbourhoods[moves]
+
+            win = (boards[active[:, None, None], FIVE_WINDOWS[moves]] == active_players[:, None, None]).all(axis=-1).any(axis=-1)
+            full = ~(boards[active, :CELL_COUNT] == EMPTY).any(axis=1)
+            winners[active] = np.where(win, active_players, winners[active])
+            done[active] = win | full
+            players[active] = -active_players
+
+        if self.heuristic is None:
+            values = (winners * root_players).astype(np.float64)
+            return values.reshape(len(states), n_rollout).mean(axis=1)
+        values = np.zeros(k, dtype=np.float64)
+        open_rows = rows[~done]
+        if len(open_rows) > 0:
+            open_values, _ = self.heuristic.evaluate_batch(boards[open_rows, :CELL_COUNT].reshape(-1, WIDTH, WIDTH), players[open_rows])
+            values[open_rows] = np.where(players[open_rows] == root_players[open_rows], open_values, -open_values)
+        return values.reshape(len(states), n_rollout).mean(axis=1)
+
+
+    def choose_moves(self, boards: np.ndarray, players: np.ndarray, rng: np.random.Generator, near: Optional[np.ndarray]=None) -> np.ndarray:
+        # one cell per board: with probability epsilon weighted by the important positions of the heuristic,
+        # otherwise uniform over the empty cells, or over candidates.candidate_mask when near is given
+        legal = boards[:, :CELL_COUNT] == EMPTY
+        if near is not None:
+            candidates = legal & near
+            fallback = ~candidates.any(axis=1)
+            if fallback.any():
+                centre = legal[fallback] & CENTRE
+                candidates[fallback] = np.where(centre.any(axis=1, keepdims=True), centre, legal[fallback])
+            legal = candidates
+        weights = legal.astype(np.float64)
+        if self.heuristic is not None and self.epsilon > 0:
+            weighted = np.flatnonzero(rng.random(len(boards)) < self.epsilon)
+            if len(weighted) > 0:
+                important = self.heuristic.important_batch(boards[weighted, :CELL_COUNT].reshape(-1, WIDTH, WIDTH), players[weighted])
+                important = important.reshape(len(weighted), CELL_COUNT)
+                weights[weighted] = legal[weighted] * np.where(important, self.important_pos_weight, self.other_pos_weight)
+        cumulative = np.cumsum(weights, axis=1)
+        r = rng.random(len(boards)) * cumulative[:, -1]
+        # first cell whose cumulative weight exceeds r, never a cell of weight 0
+        moves = (cumulative <= r[:, None]).sum(axis=1)
+        return np.minimum(moves, CELL_COUNT - 1)
+
+
+if __name__ == "__main__":
+    # compare the mean rollout value with Rollout on a few positions
+    from constant import HEURISTIC_CFG, ROLLOUT_DEPTH, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
+    from game import Game
+    from rollout import Rollout
+
+    n_rollout = 500
+    heuristic = NumpyHeuristic(HEURISTIC_CFG)
+    batch_rollout = BatchRollout(n_rollout, ROLLOUT_DEPTH, heuristic, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+    rollout = Rollout(n_rollout, ROLLOUT_DEPTH, heuristic, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+    rnd = random.Random(0)
+    game = Game()
+    for i in range(6):
+        state = game.get_state()
+        print(f"step {state.step}: Rollout {rollout.estimate_value(state):+.3f}, BatchRollout {batch_rollout.estimate_value(state):+.3f}")
+        action = rnd.choice(state.legal_actions)
+        game.execute_action(action)
+        game.check(action)
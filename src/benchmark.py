@@ -0,0 +1,713 @@
+from constant import WIDTH, WIN_LEN, EMPTY, BLACK, WHITE
+
+from constant import HEURISTIC_CFG, ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
+from constant import MCTS_SELECT_UCT, MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+
+from game import GameAction, GameState, Game
+from heuristic import Heuristic
+from rollout import Rollout, get_next_state, get_terminal_value
+from mcts_config import MCTSConfig
+from mcts import MCTS
+from search_stats import SearchStats
+
+from typing import List, Optional, Tuple, Callable
+
+import argparse
+import itertools
+import random
+import time
+
+
+def time_ops(fn: Callable[[], None], n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    end = time.perf_counter()
+    return n / (end - start)
+
+
+def random_states(n_states: int, max_step: int, seed: int) -> List[Tuple[GameState, GameAction]]:
+    # (state, legal action) pairs drawn from random unfinished games
+    rnd = random.Random(seed)
+    samples = []
+    while len(samples) < n_states:
+        game = Game()
+        for _ in range(rnd.randint(0, max_step)):
+            action = rnd.choice(game.get_state().legal_actions)
+            game.execute_action(action)
+            if game.check(action):
+                break
+        state = game.get_state()
+        if not state.done:
+            samples.append((state, rnd.choice(state.legal_actions)))
+    return samples
+
+
+class ListBoardGame:
+    # the List[List[int]] engine that Game used before bitboards, kept as the speed reference
+    def __init__(self, board: Tuple[Tuple[int, ...], ...], player: int, step: int):
+        self._board = [list(row) for row in board]
+        self._player = player
+        self._step = step
+
+    def execute_action(self, action: GameAction) -> bool:
+        if self._board[action.x][action.y] != EMPTY:
+            return False
+        self._board[action.x][action.y] = self._player
+        self._player *= -1
+        self._step += 1
+        return True
+
+    def check(self, action: GameAction) -> bool:
+        x, y = action.x, action.y
+        player = self._board[x][y]
+        for dx, dy in [(1,0),(0,1),(1,1),(1,-1)]:
+            cnt = 1
+            for sign in (1, -1):
+                i = 1
+                while True:
+                    nx, ny = x + sign*dx*i, y + sign*dy*i
+                    if 0 <= nx < WIDTH and 0 <= ny < WIDTH and self._board[nx][ny] == player:
+                        cnt += 1
+                        i += 1
+                    else:
+                        break
+            if cnt >= WIN_LEN:
+                return True
+        return self._step == WIDTH * WIDTH
+
+    def get_state(self) -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[GameAction, ...]]:
+        board = tuple(tuple(row) for row in self._board)
+        legal_actions = tuple([action for action in GameAction.ALL_ACTIONS if board[action.x][action.y] == EMPTY])
+        return board, legal_actions
+
+
+def bench_game(n_states: int=200, n_repeat: int=20, seed: int=0):
+    samples = random_states(n_states, WIDTH * WIDTH // 2, seed)
+    n = n_states * n_repeat
+
+    def run(fn):
+        it = iter(samples * n_repeat)
+        return time_ops(lambda: fn(*next(it)), n)
+
+    def bit_check(state, action):
+        game = Game(state)
+        game.execute_action(action)
+        game.check(action)
+
+    def list_check(state, action):
+        game = ListBoardGame(state.board, state.next_player, state.step)
+        game.execute_action(action)
+        game.check(action)
+
+    def bit_next_state(state, action):
+        get_next_state(state, action)
+
+    def list_next_state(state, action):
+        game = ListBoardGame(state.board, state.next_player, state.step)
+        game.execute_action(action)
+        game.check(action)
+        game.get_state()
+
+    print(f"{'':24}{'list board':>14}{'bitboard':>14}{'speedup':>10}")
+    for title, list_fn, bit_fn in [
+        ("execute_action+check", list_check, bit_check),
+        ("get_next_state", list_next_state, bit_next_state),
+    ]:
+        list_ops = run(list_fn)
+        bit_ops = run(bit_fn)
+        print(f"{title:24}{list_ops:>12.0f}/s{bit_ops:>12.0f}/s{bit_ops / list_ops:>9.2f}x")
+
+
+def state_roll_out(rollout: Rollout, state: GameState) -> Tuple[GameState, int]:
+    # Rollout.roll_out before RolloutBoard: one Game.get_state per simulated move
+    game_inst = Game(state)
+    cur_depth = 0
+    while not state.done and cur_depth < rollout.depth:
+        legal_action_list = state.legal_actions
+        if rollout.heuristic and random.random() < rollout.epsilon:
+            _, important_pos_list = rollout.heuristic.estimate_value(state)
+            weights = []
+            for action in legal_action_list:
+                if (action.x, action.y) in important_pos_list:
+                    weights.append(rollout.important_pos_weight)
+                else:
+                    weights.append(rollout.other_pos_weight)
+            action = random.choices(legal_action_list, weights=weights, k=1)[0]
+        else:
+            action = random.choice(legal_action_list)
+        game_inst.execute_action(action)
+        game_inst.check(action)
+        state = game_inst.get_state()
+        cur_depth += 1
+    return state, cur_depth
+
+
+def bench_rollout(n_states: int=20, n_repeat: int=5, seed: int=0):
+    samples = [state for state, _ in random_states(n_states, WIDTH * WIDTH // 2, seed)]
+    n = n_states * n_repeat
+
+    print(f"{'':24}{'get_state':>14}{'RolloutBoard':>14}{'speedup':>10}")
+    for epsilon in [ROLLOUT_USE_HEURISTIC_EPSILON, 0.0]:
+        rollout = Rollout(
+            ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, Heuristic(HEURISTIC_CFG),
+            ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, epsilon)
+        it = iter(samples * n_repeat)
+        state_ops = time_ops(lambda: state_roll_out(rollout, next(it)), n)
+        it = iter(samples * n_repeat)
+        board_ops = time_ops(lambda: rollout.roll_out(next(it)), n)
+        title = f"roll_out epsilon={epsilon}"
+        print(f"{title:24}{state_ops:>12.0f}/s{board_ops:>12.0f}/s{board_ops / state_ops:>9.2f}x")
+
+
+def bench_batch_rollout(n_states: int=10, seed: int=0):
+    from heuristic import make_heuristic
+    from batch_rollout import BatchRollout
+
+    samples = [state for state, _ in random_states(n_states, WIDTH * WIDTH // 2, seed)]
+    print(f"{'':28}{'Rollout':>14}{'BatchRollout':>14}{'speedup':>10}")
+    for n_rollout in [2, 8, 32, 128]:
+        rollout = Rollout(
+            n_rollout, ROLLOUT_DEPTH, make_heuristic(HEURISTIC_CFG, "incremental"),
+            ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+        batch_rollout = BatchRollout(
+            n_rollout, ROLLOUT_DEPTH, make_heuristic(HEURISTIC_CFG, "numpy"),
+            ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+        # rollouts per second
+        it = iter(samples)
+        rollout_ops = time_ops(lambda: rollout.estimate_value(next(it)), n_states) * n_rollout
+        it = iter(samples)
+        batch_ops = time_ops(lambda: batch_rollout.estimate_value(next(it)), n_states) * n_rollout
+        title = f"rollout_per_simu={n_rollout}"
+        print(f"{title:28}{rollout_ops:>12.0f}/s{batch_ops:>12.0f}/s{batch_ops / rollout_ops:>9.2f}x")
+    # every leaf of the batch in one estimate_values call
+    batch_rollout = BatchRollout(
+        ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, make_heuristic(HEURISTIC_CFG, "numpy"),
+        ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+    batch_ops = time_ops(lambda: batch_rollout.estimate_values(samples), 1) * n_states * ROLLOUT_PER_SIMU
+    title = f"{n_states} leaves x {ROLLOUT_PER_SIMU}"
+    print(f"{title:28}{'-':>14}{batch_ops:>12.0f}/s")
+
+
+def game_sequences(n_games: int, seed: int) -> List[List[GameState]]:
+    # every state of random games, in move order
+    rnd = random.Random(seed)
+    games = []
+    for _ in range(n_games):
+        game = Game()
+        states = [game.get_state()]
+        while not states[-1].done:
+            action = rnd.choice(states[-1].legal_actions)
+            game.execute_action(action)
+            game.check(action)
+            states.append(game.get_state())
+        games.append(states[:-1])
+    return games
+
+
+def bench_heuristic(n_states: int=50, n_repeat: int=4, seed: int=0):
+    import numpy as np
+    from heuristic import make_heuristic
+
+    samples = [state for state, _ in random_states(n_states, WIDTH * WIDTH // 2, seed)]
+    sequences = game_sequences(4, seed)
+    n_sequence_states = sum(len(states) for states in sequences)
+    backends = ["python", "numpy", "incremental"]
+
+    def run_sequences(backend):
+        # a fresh heuristic per game, so the incremental backend starts without cached parents
+        for states in sequences:
+            heuristic = make_heuristic(HEURISTIC_CFG, backend)
+            for state in states:
+                heuristic.estimate_value(state)
+
+    print(f"{'':28}" + "".join(f"{backend:>14}" for backend in backends))
+    rows = {"evaluate (from scratch)": [], "estimate_value along games": []}
+    for backend in backends:
+        heuristic = make_heuristic(HEURISTIC_CFG, backend)
+        it = iter([(state.board, state.next_player) for state in samples] * n_repeat)
+        rows["evaluate (from scratch)"].append(time_ops(lambda: heuristic.evaluate(*next(it)), n_states * n_repeat))
+        rows["estimate_value along games"].append(time_ops(lambda: run_sequences(backend), 1) * n_sequence_states)
+    heuristic = make_heuristic(HEURISTIC_CFG, "numpy")
+    boards = np.array([state.board for state in samples], dtype=np.int8)
+    players = np.array([state.next_player for state in samples], dtype=np.int8)
+    rows[f"numpy evaluate_batch K={n_states}"] = [None, time_ops(lambda: heuristic.evaluate_batch(boards, players), n_repeat) * n_states, None]
+    for title, ops_list in rows.items():
+        print(f"{title:28}" + "".join(f"{ops:>12.0f}/s" if ops is not None else f"{'-':>14}" for ops in ops_list))
+
+
+def random_games(n_games: int, seed: int) -> List[List[Tuple[GameState, dict, int]]]:
+    # self_play.one_self_play output for random games, with random policies instead of searches
+    rnd = random.Random(seed)
+    games = []
+    for states in game_sequences(n_games, seed):
+        winner = rnd.choice([BLACK, WHITE, 0])
+        exp_list = []
+        for state in states:
+            actions = rnd.sample(state.legal_actions, min(len(state.legal_actions), 20))
+            weights = [rnd.random() for _ in actions]
+            exp_list.append((state, {action: w / sum(weights) for action, w in zip(actions, weights)}, winner))
+        games.append(exp_list)
+    return games
+
+
+def bench_storage(n_games: int=50, seed: int=0):
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    from dataset import SelfPlayDataset, ShardWriter, augment, exps_to_records
+    from self_play import exp_to_dict
+    from utils import read_file_to_dict, save_dict_to_file
+
+    games = random_games(n_games, seed)
+    n_positions = sum(len(exp_list) for exp_list in games)
+    out_dir = tempfile.mkdtemp()
+    try:
+        # the json conversion is part of the writer, like exps_to_records for the shards
+        json_dir = os.path.join(out_dir, "json")
+        os.makedirs(json_dir)
+        start = time.perf_counter()
+        for i, exp_list in enumerate(games):
+            save_dict_to_file([exp_to_dict(exp) for exp in exp_list], os.path.join(json_dir, f"{i:04}.json"))
+        json_seconds = time.perf_counter() - start
+
+        shard_dir = os.path.join(out_dir, "shard")
+        start = time.perf_counter()
+        with ShardWriter(shard_dir) as writer:
+            for exp_list in games:
+                writer.write(exps_to_records(exp_list))
+        shard_seconds = time.perf_counter() - start
+
+        # reading everything back, then random batches as a training loop would draw them
+        start = time.perf_counter()
+        for name in sorted(os.listdir(json_dir)):
+            read_file_to_dict(os.path.join(json_dir, name))
+        json_read_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        dataset = SelfPlayDataset(shard_dir)
+        dataset.gather(np.arange(len(dataset)))
+        shard_read_seconds = time.perf_counter() - start
+        rng = np.random.default_rng(seed)
+        batches = [rng.integers(0, len(dataset), 256) for _ in range(100)]
+        it = iter(batches)
+        gather_ops = time_ops(lambda: dataset.gather(next(it)), len(batches)) * 256
+
+        def dir_bytes(path):
+            return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        print(f"{n_games} games, {n_positions} positions")
+        print(f"{'':16}{'bytes/position':>16}{'write':>14}{'read all':>14}")
+        for title, path, seconds, read_seconds in [("json", json_dir, json_seconds, json_read_seconds), ("shard", shard_dir, shard_seconds, shard_read_seconds)]:
+            print(f"{title:16}{dir_bytes(path) / n_positions:>16.0f}{n_positions / seconds:>12.0f}/s{n_positions / read_seconds:>12.0f}/s")
+        print(f"shard gather of 256 random positions: {gather_ops:.0f} positions/s")
+
+        def loop_augment(records):
+            # per record and symmetry with np.rot90 / transpose, the reference for augment
+            out = []
+            for record in records:
+                board, policy = record["board"], record["policy"].reshape(WIDTH, WIDTH)
+                for k in range(4):
+                    out.append((np.rot90(board, k), np.rot90(policy, k)))
+                    out.append((np.rot90(board.T, k), np.rot90(policy.T, k)))
+            return out
+
+        batch = dataset.gather(batches[0])
+        loop_ops = time_ops(lambda: loop_augment(batch), 10) * 256 * 8
+        augment_ops = time_ops(lambda: augment(batch), 10) * 256 * 8
+        print(f"8-fold augmentation of 256 positions: loop {loop_ops:.0f}/s, augment {augment_ops:.0f}/s ({augment_ops / loop_ops:.1f}x)")
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def make_mcts_config(n_simulations: int, **kwargs) -> MCTSConfig:
+    return MCTSConfig(
+        n_simulations, MCTS_SELECT_UCT,
+        ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG,
+        ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON,
+        HEURISTIC_CFG,
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT,
+        **kwargs
+    )
+
+
+class TreeOnlyMCTS(MCTS):
+    # random leaf values, so that only selection, expansion and backup are timed
+    def evaluate_leaf(self, state: GameState, stats: Optional[SearchStats]=None) -> float:
+        if state.done:
+            return get_terminal_value(state)
+        return random.uniform(-1.0, 1.0)
+
+
+def time_searches(agent: MCTS, states: List[GameState], n_simulations: int) -> float:
+    # simulations per second
+    start = time.perf_counter()
+    for state in states:
+        agent.search(state)
+    return len(states) * n_simulations / (time.perf_counter() - start)
+
+
+def bench_tree(n_states: int=3, seed: int=0):
+    # imported up front, so that the numpy import is not timed
+    import array_tree
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    backends = ["object", "array"]
+
+    print(f"{'':28}" + "".join(f"{backend:>14}" for backend in backends) + f"{'speedup':>10}")
+    for title, agent_cls, n_simulations in [
+        ("tree only, 700 simu", TreeOnlyMCTS, 700),
+        ("tree only, 10000 simu", TreeOnlyMCTS, 10000),
+        ("full search, 700 simu", MCTS, 700),
+    ]:
+        ops_list = []
+        for backend in backends:
+            random.seed(seed)
+            agent = agent_cls(make_mcts_config(n_simulations, tree_backend=backend, reuse_tree=False))
+            ops_list.append(time_searches(agent, states, n_simulations))
+        print(f"{title:28}" + "".join(f"{ops:>12.0f}/s" for ops in ops_list) + f"{ops_list[1] / ops_list[0]:>9.2f}x")
+
+
+def bench_symmetry(n_games: int=3, n_moves: int=6, n_simulations: int=700, seed: int=0):
+    # the first moves of self-play games, where symmetric positions are common
+    print(f"{'':12}{'simu/s':>14}{'tt hit':>10}{'cache hit':>11}{'root children':>15}")
+    for use_symmetry in [False, True]:
+        random.seed(seed)
+        agent = MCTS(make_mcts_config(n_simulations, use_symmetry=use_symmetry))
+        n_searches = 0
+        root_children = 0
+        start = time.perf_counter()
+        for _ in range(n_games):
+            game = Game()
+            for _ in range(n_moves):
+                action, _, _ = agent.search(game.get_state())
+                root_children += len(agent._root.get_visit_counts())
+                n_searches += 1
+                game.execute_action(action)
+                game.check(action)
+        ops = n_searches * n_simulations / (time.perf_counter() - start)
+        title = "symmetry" if use_symmetry else "plain"
+        print(f"{title:12}{ops:>12.0f}/s{agent.transposition_table.hit_rate():>10.2%}{agent.eval_cache.hit_rate():>11.2%}{root_children / n_searches:>15.1f}")
+
+
+def bench_instrument(n_states: int=3, n_simulations: int=700, seed: int=0):
+    # cost of MCTSConfig.instrument, and where the time of a search goes
+    from search_stats import PHASES
+
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    print(f"{'':14}{'simu/s':>14}")
+    for instrument in [False, True]:
+        random.seed(seed)
+        agent = MCTS(make_mcts_config(n_simulations, reuse_tree=False, instrument=instrument))
+        ops = time_searches(agent, states, n_simulations)
+        print(f"{'instrumented' if instrument else 'plain':14}{ops:>12.0f}/s")
+
+    random.seed(seed)
+    agent = MCTS(make_mcts_config(n_simulations, reuse_tree=False, instrument=True))
+    total = SearchStats()
+    for state in states:
+        total.add(agent.search(state)[2])
+    for phase in PHASES:
+        calls = total.phase_calls[phase]
+        us = total.phase_time[phase] / calls * 1e6 if calls else 0.0
+        print(f"{phase:14}{total.phase_time[phase]:>10.3f}s{calls:>8} calls{us:>10.1f} us/call")
+    print(f"max depth {total.max_depth}, mean depth {total.mean_depth():.1f}, rollout length {total.mean_rollout_length():.2f}, "
+          f"cache hit {total.eval_cache_hit_rate():.2%}, tt hit {total.transposition_hit_rate():.2%}")
+
+
+def play_match(cfg_a: MCTSConfig, cfg_b: MCTSConfig, n_games: int, seed: int, n_opening: int=2) -> Tuple[int, int, int]:
+    # (wins, draws, losses) of cfg_a; colours alternate, every game starts with n_opening seeded random moves
+    rnd = random.Random(seed)
+    results = [0, 0, 0]
+    for game_idx in range(n_games):
+        random.seed(seed + game_idx)
+        agents = [MCTS(cfg_a), MCTS(cfg_b)]
+        if game_idx % 2 == 1:
+            agents.reverse()
+        game = Game()
+        for _ in range(n_opening):
+            action = rnd.choice(game.get_state().legal_actions)
+            game.execute_action(action)
+            game.check(action)
+        state = game.get_state()
+        while not state.done:
+            action, _, _ = agents[state.step % 2].search(state)
+            game.execute_action(action)
+            game.check(action)
+            state = game.get_state()
+        # agents[0] plays the first move, FIRST_PLAYER
+        a_player = BLACK if game_idx % 2 == 0 else WHITE
+        if state.winner == EMPTY:
+            results[1] += 1
+        elif state.winner == a_player:
+            results[0] += 1
+        else:
+            results[2] += 1
+    return results[0], results[1], results[2]
+
+
+def bench_candidates(n_states: int=3, n_simulations: int=300, n_games: int=6, seed: int=0):
+    # MCTSConfig.candidate_radius: search speed on the same positions, and a match against the full move set
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    radii = [0, 1, 2, 3]
+    print(f"{'radius':>8}{'simu/s':>14}{'root children':>15}")
+    for radius in radii:
+        random.seed(seed)
+        agent = MCTS(make_mcts_config(n_simulations, reuse_tree=False, candidate_radius=radius))
+        ops = time_searches(agent, states, n_simulations)
+        root_children = len(agent.last_visit_counts)
+        print(f"{radius:>8}{ops:>12.0f}/s{root_children:>15}")
+
+    print(f"{'radius':>8}{'vs radius 0 (win/draw/loss)':>30}{'seconds':>10}")
+    for radius in [1, 2]:
+        start = time.perf_counter()
+        wins, draws, losses = play_match(
+            make_mcts_config(n_simulations, candidate_radius=radius), make_mcts_config(n_simulations, candidate_radius=0), n_games, seed)
+        print(f"{radius:>8}{f'{wins}/{draws}/{losses}':>30}{time.perf_counter() - start:>10.1f}")
+
+
+def bench_widening(n_states: int=3, n_simulations: int=300, n_games: int=6, seed: int=0):
+    # progressive widening with the move prior against expanding every candidate first:
+    # tree shape at the same budget, and matches where the widening agent gets a fraction of the simulations
+    plain = dict(widening_c=0.0, prior_weight=0.0)
+    widening = dict(widening_c=2.0, prior_weight=1.0)
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    print(f"{'':10}{'simu/s':>14}{'root children':>15}{'max depth':>11}{'mean depth':>12}")
+    for title, kwargs in [("plain", plain), ("widening", widening)]:
+        random.seed(seed)
+        agent = MCTS(make_mcts_config(n_simulations, reuse_tree=False, instrument=True, **kwargs))
+        start = time.perf_counter()
+        all_stats = [agent.search(state)[2] for state in states]
+        ops = len(states) * n_simulations / (time.perf_counter() - start)
+        root_children = len(agent.last_visit_counts)
+        max_depth = max(stats.max_depth for stats in all_stats)
+        mean_depth = sum(stats.mean_depth() for stats in all_stats) / len(all_stats)
+        print(f"{title:10}{ops:>12.0f}/s{root_children:>15}{max_depth:>11}{mean_depth:>12.1f}")
+
+    print(f"{'widening simu':>14}{'plain simu':>12}{'win/draw/loss':>15}{'seconds':>10}")
+    for fraction in [1, 3]:
+        start = time.perf_counter()
+        wins, draws, losses = play_match(
+            make_mcts_config(n_simulations // fraction, **widening), make_mcts_config(n_simulations, **plain), n_games, seed)
+        print(f"{n_simulations // fraction:>14}{n_simulations:>12}{f'{wins}/{draws}/{losses}':>15}{time.perf_counter() - start:>10.1f}")
+
+
+def bench_parallel(n_states: int=3, n_simulations: int=700, seed: int=0):
+    import multiprocessing
+    from parallel_mcts import ParallelMCTS
+
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    print(f"cpu count: {multiprocessing.cpu_count()}")
+    print(f"{'workers':>8}{'simu/s':>14}{'speedup':>10}")
+    base_ops = None
+    for n_workers in [1, 2, 4]:
+        with ParallelMCTS(make_mcts_config(n_simulations, reuse_tree=False), n_workers, seed=seed) as agent:
+            # the first search also pays for worker startup
+            time_searches(agent, states[:1], n_simulations)
+            ops = time_searches(agent, states, n_simulations)
+        base_ops = base_ops or ops
+        print(f"{n_workers:>8}{ops:>12.0f}/s{ops / base_ops:>9.2f}x")
+
+
+def bench_tree_parallel(n_states: int=2, n_simulations: int=700, seed: int=0):
+    import multiprocessing
+    from tree_parallel_mcts import TreeParallelMCTS
+
+    states = [state for state, _ in random_states(n_states, 10, seed)]
+    print(f"cpu count: {multiprocessing.cpu_count()}")
+    print(f"{'workers':>8}{'simu/s':>14}{'speedup':>10}{'efficiency':>12}")
+    base_ops = None
+    for n_workers in [1, 2, 4, 8, 16]:
+        with TreeParallelMCTS(make_mcts_config(n_simulations), n_workers, seed=seed) as agent:
+            # the first search also pays for worker startup
+            time_searches(agent, states[:1], n_simulations)
+            ops = time_searches(agent, states, n_simulations)
+        base_ops = base_ops or ops
+        print(f"{n_workers:>8}{ops:>12.0f}/s{ops / base_ops:>9.2f}x{ops / base_ops / n_workers:>11.0%}")
+
+
+BENCHMARKS = {
+    "game": bench_game,
+    "rollout": bench_rollout,
+    "batch_rollout": bench_batch_rollout,
+    "heuristic": bench_heuristic,
+    "tree": bench_tree,
+    "symmetry": bench_symmetry,
+    "instrument": bench_instrument,
+    "candidates": bench_candidates,
+    "widening": bench_widening,
+    "parallel": bench_parallel,
+    "tree_parallel": bench_tree_parallel,
+    "storage": bench_storage,
+}
+
+
+# suite: fixed seeded positions per game phase, (min stones, max stones)
+SUITE_PHASES = {"opening": (0, 8), "middlegame": (9, 24), "late_middlegame": (25, 40)}
+# 2: heuristic.estimate_value is timed with cold caches
+SUITE_VERSION = 2
+
+
+def phase_states(n_per_phase: int, seed: int) -> List[GameState]:
+    rnd = random.Random(seed)
+    states = []
+    for min_step, max_step in SUITE_PHASES.values():
+        n = 0
+        while n < n_per_phase:
+            game = Game()
+            target = rnd.randint(min_step, max_step)
+            while game.get_state().step < target:
+                action = rnd.choice(game.get_state().legal_actions)
+                game.execute_action(action)
+                if game.check(action):
+                    break
+            state = game.get_state()
+            if not state.done and state.step == target:
+                states.append(state)
+                n += 1
+    return states
+
+
+def measure(fn: Callable[[], None], n: int, n_memory: int) -> Tuple[float, float]:
+    # (ops/s, peak KiB): timed without tracemalloc, which slows allocation-heavy code several times,
+    # then n_memory more calls under tracemalloc for the peak
+    import tracemalloc
+    ops = time_ops(fn, n)
+    tracemalloc.start()
+    for _ in range(n_memory):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ops, peak / 1024
+
+
+def run_suite(n_per_phase: int=4, n_repeat: int=20, seed: int=0) -> dict:
+    import platform
+    from constant import HEURISTIC_BACKEND, MCTS_SIMU_COUNT_PER_SEARCH
+    from heuristic import make_heuristic
+
+    states = phase_states(n_per_phase, seed)
+    rnd = random.Random(seed)
+    pairs = [(state, rnd.choice(state.legal_actions)) for state in states]
+    results = dict()
+
+    def add(name, fn, n, n_memory, unit="ops/s", scale=1):
+        ops, peak_kb = measure(fn, n, n_memory)
+        results[name] = {"value": ops * scale, "unit": unit, "peak_kb": peak_kb}
+        print(f"{name:32}{ops * scale:>14.0f} {unit:8}{peak_kb:>10.0f} KiB")
+
+    def cycle(items):
+        it = itertools.cycle(items)
+        return lambda: next(it)
+
+    def execute_and_check(next_pair):
+        state, action = next_pair()
+        game = Game(state)
+        game.execute_action(action)
+        game.check(action)
+
+    next_pair = cycle(pairs)
+    add("game.execute_action+check", lambda: execute_and_check(next_pair), len(pairs) * n_repeat, len(pairs))
+    next_pair = cycle(pairs)
+    add("rollout.get_next_state", lambda: get_next_state(*next_pair()), len(pairs) * n_repeat, len(pairs))
+
+    # every call evaluates from scratch, the states repeat and would otherwise hit the line pattern cache of the incremental backend
+    heuristic = make_heuristic(HEURISTIC_CFG, HEURISTIC_BACKEND)
+
+    def cold_estimate(state):
+        heuristic.clear_cache()
+        heuristic.estimate_value(state)
+
+    next_state = cycle(states)
+    add("heuristic.estimate_value", lambda: cold_estimate(next_state()), len(states) * n_repeat, len(states))
+
+    rollout = Rollout(
+        ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, make_heuristic(HEURISTIC_CFG, HEURISTIC_BACKEND),
+        ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON)
+    next_state = cycle(states)
+    add("rollout.roll_out", lambda: rollout.roll_out(next_state()), len(states) * n_repeat, len(states))
+
+    # select_child / backup on the trees of tree-only searches
+    paths = []
+    for state in states:
+        agent = TreeOnlyMCTS(make_mcts_config(2000, reuse_tree=True))
+        agent.search(state)
+        node = agent._root
+        path = [node]
+        while node.is_fully_expanded() and not node.is_terminal():
+            _, node = node.select_child(MCTS_SELECT_UCT)
+            path.append(node)
+        paths.append(path)
+    next_path = cycle(paths)
+    add("mcts_node.select_child", lambda: next_path()[0].select_child(MCTS_SELECT_UCT), len(paths) * n_repeat * 10, len(paths))
+
+    def backup(path):
+        value = random.uniform(-1.0, 1.0)
+        for node in reversed(path):
+            node.update(value)
+            value = -value
+
+    next_path = cycle(paths)
+    add("mcts_node.backup (path)", lambda: backup(next_path()), len(paths) * n_repeat * 10, len(paths))
+
+    # a fresh agent at the constant.py settings for every search, so no tree is carried over
+    def search(state):
+        MCTS(make_mcts_config(MCTS_SIMU_COUNT_PER_SEARCH)).search(state)
+
+    random.seed(seed)
+    next_state = cycle(states)
+    add("mcts.search", lambda: search(next_state()), len(states), 1, "simu/s", MCTS_SIMU_COUNT_PER_SEARCH)
+
+    return {
+        "version": SUITE_VERSION,
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "n_per_phase": n_per_phase,
+        },
+        "results": results,
+    }
+
+
+def compare_suites(base: dict, new: dict, threshold: float) -> bool:
+    # True when some result of new is more than threshold slower than base
+    if base.get("version") != SUITE_VERSION or new.get("version") != SUITE_VERSION:
+        raise ValueError(f"compare_suites: both results must be suite version {SUITE_VERSION}.")
+    regressed = False
+    print(f"{'':32}{'base':>14}{'new':>14}{'ratio':>9}{'peak KiB':>20}")
+    for name, base_result in base["results"].items():
+        new_result = new["results"].get(name)
+        if new_result is None:
+            print(f"{name:32}{base_result['value']:>14.0f}{'-':>14}")
+            continue
+        ratio = new_result["value"] / base_result["value"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  <- 变慢"
+            regressed = True
+        peak = f"{base_result['peak_kb']:.0f} -> {new_result['peak_kb']:.0f}"
+        print(f"{name:32}{base_result['value']:>14.0f}{new_result['value']:>14.0f}{ratio:>8.2f}x{peak:>20}{flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    import sys
+    from utils import read_json_to_dict, save_dict_to_json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("names", nargs="*", help=f"subset of {list(BENCHMARKS.keys())}, all by default")
+    parser.add_argument("--suite", metavar="OUT_JSON", help="run the fixed-position suite and save it as json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE_JSON", "NEW_JSON"), help="compare two suite results")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+    if args.suite:
+        save_dict_to_json(run_suite(), args.suite)
+        sys.exit(0)
+    if args.compare:
+        sys.exit(1 if compare_suites(read_json_to_dict(args.compare[0]), read_json_to_dict(args.compare[1]), args.threshold) else 0)
+    for name in args.names or list(BENCHMARKS.keys()):
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,148 @@
+from constant import WIDTH, WIN_LEN, BLACK, WHITE, EMPTY, FIRST_PLAYER
+
+from typing import List, Tuple, Iterator, Dict
+
+import random
+
+
+# cell (x, y) is stored at bit x * WIDTH + y
+CELL_COUNT: int = WIDTH * WIDTH
+FULL_MASK: int = (1 << CELL_COUNT) - 1
+ROW_MASK: int = (1 << WIDTH) - 1
+
+
+def pos_to_idx(x: int, y: int) -> int:
+    return x * WIDTH + y
+
+
+def idx_to_pos(idx: int) -> Tuple[int, int]:
+    return divmod(idx, WIDTH)
+
+
+# fixed seed so that keys stay comparable across processes and runs
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_KEYS: Dict[int, List[int]] = {
+    BLACK: [_zobrist_rng.getrandbits(64) for _ in range(CELL_COUNT)],
+    WHITE: [_zobrist_rng.getrandbits(64) for _ in range(CELL_COUNT)],
+}
+# xor-ed in whenever the player to move is not FIRST_PLAYER
+ZOBRIST_SIDE: int = _zobrist_rng.getrandbits(64)
+
+
+def _build_direction_steps() -> List[Tuple[int, int]]:
+    # (dx, dy) -> (shift, mask of the cells whose neighbour along (dx, dy) is still on the board)
+    steps = []
+    for dx, dy in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        step_mask = 0
+        for x in range(WIDTH):
+            for y in range(WIDTH):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < WIDTH and 0 <= ny < WIDTH:
+                    step_mask |= 1 << pos_to_idx(x, y)
+        steps.append((dx * WIDTH + dy, step_mask))
+    return steps
+
+
+DIRECTION_STEPS: List[Tuple[int, int]] = _build_direction_steps()
+
+
+def has_five(bits: int) -> bool:
+    # run holds the cells that start a run of (k+1) stones after k rounds
+    for shift, step_mask in DIRECTION_STEPS:
+        run = bits
+        for _ in range(WIN_LEN - 1):
+            run &= (run >> shift) & step_mask
+            if not run:
+                break
+        if run:
+            return True
+    return False
+
+
+def _build_five_masks() -> List[List[int]]:
+    # every WIN_LEN-long window of cells, grouped by the cells it covers
+    five_masks: List[List[int]] = [[] for _ in range(CELL_COUNT)]
+    for dx, dy in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        for x in range(WIDTH):
+            for y in range(WIDTH):
+                cells = [(x + dx * i, y + dy * i) for i in range(WIN_LEN)]
+                if not all(0 <= cx < WIDTH and 0 <= cy < WIDTH for cx, cy in cells):
+                    continue
+                mask = 0
+                for cx, cy in cells:
+                    mask |= 1 << pos_to_idx(cx, cy)
+                for cx, cy in cells:
+                    five_masks[pos_to_idx(cx, cy)].append(mask)
+    return five_masks
+
+
+FIVE_MASKS: List[List[int]] = _build_five_masks()
+
+
+def has_five_at(bits: int, idx: int) -> bool:
+    # only looks at the windows through idx, enough right after a stone is placed there
+    for mask in FIVE_MASKS[idx]:
+        if bits & mask == mask:
+            return True
+    return False
+
+
+def _build_symmetries() -> List[List[int]]:
+    # SYMMETRIES[s][idx] is the cell idx goes to under the s-th rotation / reflection of the board, 0 is the identity
+    n = WIDTH - 1
+    transforms = [
+        lambda x, y: (x, y), lambda x, y: (y, n - x), lambda x, y: (n - x, n - y), lambda x, y: (n - y, x),
+        lambda x, y: (x, n - y), lambda x, y: (y, x), lambda x, y: (n - x, y), lambda x, y: (n - y, n - x),
+    ]
+    return [[pos_to_idx(*transform(*idx_to_pos(idx))) for idx in range(CELL_COUNT)] for transform in transforms]
+
+
+SYMMETRIES: List[List[int]] = _build_symmetries()
+
+
+# _ROW_BITS[row_bits] lists the column indices set in row_bits
+_ROW_BITS: List[Tuple[int, ...]] = [tuple([y for y in range(WIDTH) if (row_bits >> y) & 1]) for row_bits in range(1 << WIDTH)]
+
+
+def nth_bit(mask: int, n: int) -> int:
+    # index of the n-th (0-based, from the lowest) set bit of mask
+    for x in range(WIDTH):
+        row = _ROW_BITS[(mask >> (x * WIDTH)) & ROW_MASK]
+        if n < len(row):
+            return x * WIDTH + row[n]
+        n -= len(row)
+    raise ValueError("nth_bit: mask has too few set bits.")
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def bits_to_board(black: int, white: int) -> Tuple[Tuple[int, ...], ...]:
+    board = []
+    for x in range(WIDTH):
+        row = []
+        for y in range(WIDTH):
+            bit = 1 << pos_to_idx(x, y)
+            if black & bit:
+                row.append(BLACK)
+            elif white & bit:
+                row.append(WHITE)
+            else:
+                row.append(EMPTY)
+        board.append(tuple(row))
+    return tuple(board)
+
+
+def zobrist_key(black: int, white: int, next_player: int) -> int:
+    key = 0
+    for idx in iter_bits(black):
+        key ^= ZOBRIST_KEYS[BLACK][idx]
+    for idx in iter_bits(white):
+        key ^= ZOBRIST_KEYS[WHITE][idx]
+    if next_player != FIRST_PLAYER:
+        key ^= ZOBRIST_SIDE
+    return key
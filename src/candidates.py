@@ -0,0 +1,46 @@
+from constant import WIDTH
+from bitboard import CELL_COUNT, pos_to_idx, idx_to_pos, iter_bits
+
+from typing import Dict, List
+
+
+# the only move considered on an empty board
+CENTRE_BIT: int = 1 << pos_to_idx(WIDTH // 2, WIDTH // 2)
+
+_NEIGHBOURHOODS: Dict[int, List[int]] = {}
+
+
+def neighbourhood_masks(radius: int) -> List[int]:
+    # masks[idx]: the cells within Chebyshev distance radius of idx, idx included; built once per radius
+    if radius <= 0:
+        raise ValueError("neighbourhood_masks: radius must be positive.")
+    masks = _NEIGHBOURHOODS.get(radius)
+    if masks is None:
+        masks = []
+        for idx in range(CELL_COUNT):
+            x, y = idx_to_pos(idx)
+            mask = 0
+            for nx in range(max(0, x - radius), min(WIDTH, x + radius + 1)):
+                for ny in range(max(0, y - radius), min(WIDTH, y + radius + 1)):
+                    mask |= 1 << pos_to_idx(nx, ny)
+            masks.append(mask)
+        _NEIGHBOURHOODS[radius] = masks
+    return masks
+
+
+def near_mask(stones: int, radius: int) -> int:
+    # every cell within radius of a stone, from scratch; after a move it is kept up to date with
+    # near | neighbourhood_masks(radius)[idx]
+    masks = neighbourhood_masks(radius)
+    near = 0
+    for idx in iter_bits(stones):
+        near |= masks[idx]
+    return near
+
+
+def candidate_mask(legal_mask: int, near: int) -> int:
+    # the legal moves near a stone; the centre on an empty board, and every legal move once the neighbourhood is full
+    candidates = legal_mask & near
+    if candidates:
+        return candidates
+    return legal_mask & CENTRE_BIT or legal_mask
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 
 # game
 BLACK: int = 1
@@ -15,6 +15,36 @@ MCTS_SIMU_COUNT_PER_SEARCH = 700
 MCTS_SELECT_UCT = 0.2
 MCTS_ROLLOUT_WEIGHT: float = 0.6
 MCTS_HEURISTIC_WEIGHT: float = 1.0 - MCTS_ROLLOUT_WEIGHT
+# keep the subtree of the new root between searches, looked up this many plies below the previous root
+MCTS_REUSE_TREE: bool = True
+MCTS_REUSE_TREE_DEPTH: int = 2
+# nodes indexed by zobrist key so that transposed positions share statistics, 0 disables it
+MCTS_TRANSPOSITION_TABLE_SIZE: int = 200000
+# merge the 8 rotations / reflections of a position (symmetry.py): canonical keys for the transposition table and
+# the evaluation cache, and one expanded action per orbit of symmetric moves. The array backend only uses the cache part
+MCTS_USE_SYMMETRY: bool = False
+# "object" (MCTSNode, with the transposition table) or "array" (array_tree.ArrayTree, needs numpy)
+MCTS_TREE_BACKEND: str = "object"
+# only moves within this Chebyshev distance of a stone are expanded and played in rollouts (candidates.py), 0 considers every empty cell.
+# Off until a radius is measured to play stronger, see benchmark.py candidates
+MCTS_CANDIDATE_RADIUS: int = 0
+# progressive widening (object backend): a node has at most max(1, MCTS_WIDENING_C * N ** MCTS_WIDENING_ALPHA) children,
+# admitted in the order of move_prior.move_priors; 0 expands every candidate before UCT selection starts.
+# Widening and the prior are off until measured over more games, see benchmark.py widening
+MCTS_WIDENING_C: float = 0.0
+MCTS_WIDENING_ALPHA: float = 0.5
+# weight of the move prior in select_child, MCTS_PRIOR_WEIGHT * P(a) * sqrt(N) / (1 + n(a)) is added to the UCT score
+MCTS_PRIOR_WEIGHT: float = 0.0
+# prior of the important positions of Heuristic relative to their pattern score
+MCTS_PRIOR_IMPORTANT_WEIGHT: float = 4.0
+# anytime search (MCTS.search with time_budget_ms or max_simulations): simulations between two clock and stop checks
+MCTS_CLOCK_CHECK_INTERVAL: int = 16
+# deadline of one search in app.py and self_play.py, None searches MCTS_SIMU_COUNT_PER_SEARCH simulations
+MCTS_TIME_BUDGET_MS: Optional[int] = None
+# time the phases of every simulation and record tree depths in the SearchStats returned by MCTS.search (search_stats.py)
+MCTS_INSTRUMENT: bool = False
+# value added to every node on a path while its simulation is in flight (tree_parallel_mcts.py)
+MCTS_VIRTUAL_LOSS: float = 1.0
 
 
 # rollout
@@ -24,6 +54,8 @@ ROLLOUT_DEPTH = 5
 ROLLOUT_USE_HEURISTIC_EPSILON: float = 1.0
 ROLLOUT_IMPORTANT_POS_WEIGHT: int = 15
 ROLLOUT_OTHER_POS_WEIGHT: int = 1
+# "python" (Rollout, one rollout after another) or "numpy" (batch_rollout.BatchRollout, all rollouts of a leaf in lockstep)
+ROLLOUT_BACKEND: str = "python"
 
 # heuristic
 HEURISTIC_ADVANTAGE_WEIGHT_DICT: Dict[str, int] = {
@@ -47,6 +79,23 @@ HEURISTIC_EMPTY_ADVANTAGE_WEIGHT: float = 1.0 - HEURISTIC_ADVANTAGE_WEIGHT
 
 HEURISTIC_IMMEDIATE_WIN_WEIGHT: float = 0.8
 
+# "python", "numpy" or "incremental"
+HEURISTIC_BACKEND: str = "incremental"
+
+# bytes of the per-position line patterns kept by each incremental heuristic (an MCTS has two), least recently used dropped first
+HEURISTIC_PATTERN_CACHE_BYTES: int = 32 * 1024 * 1024
+
+# entries of the evaluation cache shared by the heuristics of one MCTS, 0 disables it
+HEURISTIC_EVAL_CACHE_SIZE: int = 200000
+
+# sqlite file with heuristic values and search results kept across runs, used by app.py and self_play.py
+EVAL_STORE_PATH: str = "storage/eval_store.sqlite"
+# only positions with at most this many stones go to the store, deeper ones rarely come back
+EVAL_STORE_MAX_STEP: int = 12
+
+# self-play data (dataset.py): positions per binary shard, 245 bytes each
+SELF_PLAY_SHARD_SIZE: int = 65536
+
 HEURISTIC_CFG = {
     "advantage_weight": HEURISTIC_ADVANTAGE_WEIGHT,
     "empty_advantage_weight": HEURISTIC_EMPTY_ADVANTAGE_WEIGHT,
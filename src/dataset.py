@@ -0,0 +1,259 @@
+from constant import WIDTH, SELF_PLAY_SHARD_SIZE
+from game import GameAction, GameState
+from bitboard import CELL_COUNT, SYMMETRIES
+
+from typing import Dict, List, Optional, Tuple, Union
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from utils import read_file_to_dict
+
+
+DATASET_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# one position per record, 245 bytes
+RECORD_DTYPE = np.dtype([
+    ("board", np.int8, (WIDTH, WIDTH)),
+    ("player", np.int8),
+    ("policy", np.float16, (CELL_COUNT,)),
+    ("result", np.int8),
+])
+
+
+# SYMMETRY_SOURCES[s, idx] is the cell that symmetry s moves to idx, so a transformed flat board is board[..., SYMMETRY_SOURCES[s]]
+SYMMETRY_SOURCES: np.ndarray = np.argsort(np.array(SYMMETRIES, dtype=np.int64), axis=1)
+
+
+def augment(records: np.ndarray, symmetries: Optional[np.ndarray]=None) -> np.ndarray:
+    # symmetries None: all 8 symmetries of every record, (K * 8,) in record-major order;
+    # otherwise one symmetry per record, e.g. drawn at random for each training batch.
+    # Board and policy each take one fancy-index gather
+    k = len(records)
+    boards = records["board"].reshape(k, CELL_COUNT)
+    if symmetries is None:
+        sources = SYMMETRY_SOURCES[np.newaxis, :, :]
+        out = np.empty(k * len(SYMMETRIES), dtype=RECORD_DTYPE)
+        out["board"] = boards[np.arange(k)[:, None, None], sources].reshape(-1, WIDTH, WIDTH)
+        out["policy"] = records["policy"][np.arange(k)[:, None, None], sources].reshape(-1, CELL_COUNT)
+        out["player"] = np.repeat(records["player"], len(SYMMETRIES))
+        out["result"] = np.repeat(records["result"], len(SYMMETRIES))
+        return out
+    sources = SYMMETRY_SOURCES[np.asarray(symmetries)]
+    out = records.copy()
+    out["board"] = np.take_along_axis(boards, sources, axis=1).reshape(k, WIDTH, WIDTH)
+    out["policy"] = np.take_along_axis(records["policy"], sources, axis=1)
+    return out
+
+
+def exps_to_records(exp_list: List[Tuple[GameState, Dict[GameAction, float], int]]) -> np.ndarray:
+    # (state, visit_rate_dict, result) as returned by self_play.one_self_play
+    records = np.zeros(len(exp_list), dtype=RECORD_DTYPE)
+    for i, (state, visit_rate_dict, result) in enumerate(exp_list):
+        records["board"][i] = state.board
+        records["player"][i] = state.next_player
+        for action, visit_rate in visit_rate_dict.items():
+            records["policy"][i, action.idx] = visit_rate
+        records["result"][i] = result
+    return records
+
+
+def dicts_to_records(exp_dict_list: List[dict]) -> np.ndarray:
+    # the json records of self_play.exp_to_dict
+    records = np.zeros(len(exp_dict_list), dtype=RECORD_DTYPE)
+    for i, exp in enumerate(exp_dict_list):
+        records["board"][i] = exp["state"]["board"]
+        records["player"][i] = exp["state"]["next_player"]
+        records["policy"][i] = np.ravel(exp["policy"])
+        records["result"][i] = exp["result"]
+    return records
+
+
+class ShardWriter:
+    # appends records to out_dir/shard_XXXXX.bin, shard_size records per file, raw RECORD_DTYPE without header.
+    # manifest.json lists the shards and their record counts and is rewritten after every write,
+    # so a reader never sees records that are not in the manifest. An existing dataset is appended to,
+    # a new one gets an empty manifest right away. "sources" lists the files already converted by convert_json
+    def __init__(self, out_dir: str, shard_size: int=SELF_PLAY_SHARD_SIZE):
+        if shard_size <= 0:
+            raise ValueError("ShardWriter: shard_size must be positive.")
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest = read_manifest(out_dir) if os.path.exists(os.path.join(out_dir, MANIFEST_NAME)) else None
+        if self.manifest is None:
+            self.manifest = {"version": DATASET_VERSION, "dtype": dtype_description(), "shard_size": shard_size, "count": 0, "shards": [], "sources": []}
+            self._write_manifest()
+        self.shard_size = self.manifest["shard_size"]
+        self._file = None
+        shards = self.manifest["shards"]
+        if shards:
+            # bytes written after the last manifest update, e.g. by a run that was killed
+            with open(os.path.join(out_dir, shards[-1]["file"]), "ab") as file:
+                file.truncate(shards[-1]["count"] * RECORD_DTYPE.itemsize)
+
+
+    def write(self, records: np.ndarray, source: Optional[str]=None) -> None:
+        # source: the file the records come from, recorded in the same manifest update as the records
+        if records.dtype != RECORD_DTYPE:
+            raise ValueError("ShardWriter: records must have RECORD_DTYPE.")
+        shards = self.manifest["shards"]
+        start = 0
+        while start < len(records):
+            if not shards or shards[-1]["count"] >= self.shard_size:
+                self._close_file()
+                shards.append({"file": f"shard_{len(shards):05}.bin", "count": 0})
+            shard = shards[-1]
+            if self._file is None:
+                self._file = open(os.path.join(self.out_dir, shard["file"]), "ab")
+            n = min(len(records) - start, self.shard_size - shard["count"])
+            self._file.write(records[start:start + n].tobytes())
+            shard["count"] += n
+            start += n
+        if self._file is not None:
+            self._file.flush()
+        self.manifest["count"] = sum(shard["count"] for shard in shards)
+        if source is not None:
+            self.manifest["sources"].append(source)
+        self._write_manifest()
+
+
+    def _write_manifest(self) -> None:
+        # replaced in one step, a crash leaves the previous manifest
+        path = os.path.join(self.out_dir, MANIFEST_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def close(self) -> None:
+        self._close_file()
+
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def dtype_description() -> List[List]:
+    return [[name, RECORD_DTYPE[name].base.str, list(RECORD_DTYPE[name].shape)] for name in RECORD_DTYPE.names]
+
+
+def read_manifest(data_dir: str) -> dict:
+    with open(os.path.join(data_dir, MANIFEST_NAME), "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("version") != DATASET_VERSION or manifest.get("dtype") != dtype_description():
+        raise ValueError(f"{data_dir}: dataset written with another version or record layout.")
+    # datasets written before sources were recorded
+    manifest.setdefault("sources", [])
+    return manifest
+
+
+class SelfPlayDataset:
+    # read-only view of a ShardWriter directory, every shard memory-mapped.
+    # All shards but the last are full, so a global index maps to (shard, offset) with one division
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.manifest = read_manifest(data_dir)
+        self.shard_size = self.manifest["shard_size"]
+        self.shards = [
+            np.memmap(os.path.join(data_dir, shard["file"]), dtype=RECORD_DTYPE, mode="r", shape=(shard["count"],))
+            for shard in self.manifest["shards"]
+        ]
+        self._len = sum(len(shard) for shard in self.shards)
+
+
+    def __len__(self) -> int:
+        return self._len
+
+
+    def __getitem__(self, idx: int) -> np.void:
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError(f"SelfPlayDataset: index {idx} out of range.")
+        return self.shards[idx // self.shard_size][idx % self.shard_size]
+
+
+    def gather(self, indices: Union[List[int], np.ndarray], symmetries: Union[None, str, np.ndarray]=None) -> np.ndarray:
+        # records of indices as one RECORD_DTYPE array in the order given, one fancy-index read per shard touched.
+        # symmetries: None for the stored records, "all" for the 8 symmetries of each, or one symmetry per index (see augment)
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + self._len, indices)
+        if len(indices) and (indices.min() < 0 or indices.max() >= self._len):
+            raise IndexError("SelfPlayDataset: index out of range.")
+        shard_idx = indices // self.shard_size
+        local_idx = indices % self.shard_size
+        records = np.empty(len(indices), dtype=RECORD_DTYPE)
+        for shard in np.unique(shard_idx):
+            selected = shard_idx == shard
+            records[selected] = self.shards[shard][local_idx[selected]]
+        if symmetries is None:
+            return records
+        return augment(records, None if isinstance(symmetries, str) and symmetries == "all" else symmetries)
+
+
+def game_json_paths(data_dir: str) -> List[str]:
+    # the NNNN.json game files of self_play.py in data_dir, without manifest.json or other json files
+    return [path for path in glob.glob(os.path.join(data_dir, "*.json")) if os.path.basename(path)[:-5].isdigit()]
+
+
+def is_game_json(data) -> bool:
+    # the list of self_play.exp_to_dict records of one game
+    if not isinstance(data, list):
+        return False
+    for exp in data:
+        if not isinstance(exp, dict) or not isinstance(exp.get("state"), dict) or "result" not in exp:
+            return False
+        if np.shape(exp["state"].get("board")) != (WIDTH, WIDTH) or np.shape(exp.get("policy")) != (WIDTH, WIDTH) or "next_player" not in exp["state"]:
+            return False
+    return True
+
+
+def convert_json(json_paths: List[str], out_dir: str) -> Tuple[int, int]:
+    # migrates the per-game json files of self_play.py -> (files converted, positions written).
+    # Files already listed in the manifest are skipped, so running it again only adds the new games;
+    # files that are not games are skipped with a message and not recorded
+    n_files = 0
+    n_positions = 0
+    with ShardWriter(out_dir) as writer:
+        converted = set(writer.manifest["sources"])
+        for path in sorted(json_paths):
+            source = os.path.abspath(path)
+            if source in converted:
+                continue
+            data = read_file_to_dict(path)
+            if not is_game_json(data):
+                print(f"跳过 {path}: 不是自我对弈的对局文件")
+                continue
+            records = dicts_to_records(data)
+            writer.write(records, source)
+            converted.add(source)
+            n_files += 1
+            n_positions += len(records)
+    return n_files, n_positions
+
+
+if __name__ == "__main__":
+    # python src/dataset.py storage/*.json --out storage/shards
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="self-play json files, the NNNN.json files of storage by default")
+    parser.add_argument("--out", default="storage/shards")
+    args = parser.parse_args()
+    json_paths = args.paths or game_json_paths("storage")
+    n_files, n_positions = convert_json(json_paths, args.out)
+    dataset = SelfPlayDataset(args.out)
+    print(f"转换 {n_files} 个文件, {n_positions} 个局面, 跳过 {len(json_paths) - n_files} 个已转换或无效的文件, 数据集共 {len(dataset)} 个局面")
@@ -0,0 +1,79 @@
+from eval_store import EvalStore
+
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class EvalCache:
+    # bounded LRU of heuristic evaluations, shared by every Heuristic of one MCTS
+    # entries are (value, important positions as a bitmask)
+    # with a store, positions of at most store_max_step stones are also read from and written to disk
+    # symmetric: Heuristic.estimate_value keys positions by their canonical key (see symmetry.py), an entry then holds
+    # the image whose own key is that canonical key, so it stays valid for caches and stores without symmetry
+    def __init__(self, max_size: int, store: Optional[EvalStore]=None, store_max_step: int=0, symmetric: bool=False):
+        if max_size <= 0:
+            raise ValueError("EvalCache: max_size must be positive.")
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self.store = store
+        self.store_max_step = store_max_step
+        self.symmetric = symmetric
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key: Hashable, step: Optional[int]=None) -> Optional[Tuple[float, int]]:
+        # step is the stone count of the position, None keeps the lookup in memory
+        entry = self._entries.get(key)
+        if entry is None:
+            if self.store is not None and step is not None and step <= self.store_max_step:
+                entry = self.store.get_eval(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._put_memory(key, entry)
+            self.hits += 1
+            return entry
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+
+    def put(self, key: Hashable, entry: Tuple[float, int], step: Optional[int]=None) -> None:
+        if self.store is not None and step is not None and step <= self.store_max_step:
+            self.store.add_eval(key, entry)
+        self._put_memory(key, entry)
+
+
+    def _put_memory(self, key: Hashable, entry: Tuple[float, int]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate(),
+        }
@@ -0,0 +1,151 @@
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import json
+import os
+import sqlite3
+
+
+# bump when the tables change, older files are rebuilt
+STORE_VERSION: int = 1
+
+
+def _to_sqlite_int(key: int) -> int:
+    # zobrist keys are unsigned 64-bit, sqlite integers are signed
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+def _from_sqlite_int(key: int) -> int:
+    return key + (1 << 64) if key < 0 else key
+
+
+def _mask_to_blob(mask: int) -> bytes:
+    # important masks are wider than 64 bits
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+class EvalStore:
+    # sqlite file with heuristic values and search results, shared across runs
+    # rows carry the fingerprint of the config that produced them, so configs sharing the file (app.py, self_play.py)
+    # keep each other's rows; every lookup only reads rows of this store's fingerprints
+    def __init__(self, path: str, eval_fingerprints: Iterable[str], search_fingerprint: str):
+        self.path = path
+        self.eval_fingerprints = sorted(set(eval_fingerprints))
+        self.search_fingerprint = search_fingerprint
+
+        self._conn: Optional[sqlite3.Connection] = None
+        # every eval row, read at once by load so lookups during a search never wait on sqlite
+        self._evals: Optional[Dict[Tuple[str, int], Tuple[float, int]]] = None
+        self._pending_evals: Dict[Tuple[str, int], Tuple[float, int]] = dict()
+        self._pending_searches: Dict[int, List[Tuple[int, float]]] = dict()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+
+    def _connect(self) -> sqlite3.Connection:
+        # opened on first use, so configs that never touch the store never create the file
+        if self._conn is not None:
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # several self-play processes may share the file, a writer waits for the others instead of failing
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+                conn.execute("DROP TABLE IF EXISTS evals")
+                conn.execute("DROP TABLE IF EXISTS searches")
+                conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS evals ("
+                "fingerprint TEXT, key INTEGER, value REAL, important BLOB, "
+                "PRIMARY KEY (fingerprint, key)) WITHOUT ROWID")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "fingerprint TEXT, key INTEGER, visits TEXT, "
+                "PRIMARY KEY (fingerprint, key)) WITHOUT ROWID")
+        self._conn = conn
+        return conn
+
+
+    def load(self) -> None:
+        # reads the evals of this store's fingerprints in one query; MCTS calls it before searching, later calls do nothing
+        if self._evals is not None:
+            return
+        placeholders = ",".join("?" * len(self.eval_fingerprints))
+        rows = self._connect().execute(
+            f"SELECT fingerprint, key, value, important FROM evals WHERE fingerprint IN ({placeholders})", self.eval_fingerprints)
+        self._evals = {(fingerprint, _from_sqlite_int(key)): (value, int.from_bytes(important, 'little'))
+                       for fingerprint, key, value, important in rows}
+
+
+    def get_eval(self, cache_key: Hashable) -> Optional[Tuple[float, int]]:
+        # cache_key is the (fingerprint, zobrist key) pair used by EvalCache
+        entry = self._pending_evals.get(cache_key)
+        if entry is not None:
+            return entry
+        self.load()
+        entry = self._evals.get(cache_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+
+    def add_eval(self, cache_key: Hashable, entry: Tuple[float, int]) -> None:
+        # buffered until flush
+        self._pending_evals[cache_key] = entry
+
+
+    def get_search(self, key: int) -> Optional[List[Tuple[int, float]]]:
+        # (action idx, visit rate) pairs in the order MCTS returned them
+        visits = self._pending_searches.get(key)
+        if visits is not None:
+            return visits
+        row = self._connect().execute(
+            "SELECT visits FROM searches WHERE fingerprint = ? AND key = ?",
+            (self.search_fingerprint, _to_sqlite_int(key))).fetchone()
+        if row is None:
+            return None
+        return [(idx, rate) for idx, rate in json.loads(row[0])]
+
+
+    def add_search(self, key: int, visits: List[Tuple[int, float]]) -> None:
+        self._pending_searches[key] = visits
+
+
+    def flush(self) -> None:
+        # one transaction for everything buffered since the last flush
+        if not self._pending_evals and not self._pending_searches:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO evals VALUES (?, ?, ?, ?)",
+                [(fingerprint, _to_sqlite_int(key), value, _mask_to_blob(important))
+                 for (fingerprint, key), (value, important) in self._pending_evals.items()])
+            conn.executemany(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                [(self.search_fingerprint, _to_sqlite_int(key), json.dumps(visits))
+                 for key, visits in self._pending_searches.items()])
+        self.writes += len(self._pending_evals) + len(self._pending_searches)
+        if self._evals is not None:
+            self._evals.update(self._pending_evals)
+        self._pending_evals.clear()
+        self._pending_searches.clear()
+
+
+    def close(self) -> None:
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._evals = None
+
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
@@ -1,75 +1,146 @@
-from typing import List, Tuple, ClassVar, Dict
+from typing import List, Tuple, ClassVar, Dict, Optional
 
-from constant import WIDTH, WIN_LEN, EMPTY, FIRST_PLAYER
+from constant import WIDTH, WIN_LEN, EMPTY, BLACK, WHITE, FIRST_PLAYER
+from bitboard import CELL_COUNT, FULL_MASK, ROW_MASK, ZOBRIST_KEYS, ZOBRIST_SIDE, pos_to_idx, has_five, bits_to_board, zobrist_key
 
 class GameAction:
     EMPTY_ACTION: ClassVar["GameAction"]
     ALL_ACTIONS: ClassVar[List["GameAction"]]
-    
+
     def __init__(self, x: int, y: int):
         self.x = x
         self.y = y
-        
+        self.idx = pos_to_idx(x, y)
+
     def __eq__(self, other):
         if not isinstance(other, GameAction):
             return False
         if self.x != other.x or self.y != other.y:
             return False
         return True
-    
+
     def __hash__(self):
         return hash((self.x, self.y))
 
 
 GameAction.EMPTY_ACTION = GameAction(-1, -1)
+# ALL_ACTIONS[idx] is the action placed on bit idx
 GameAction.ALL_ACTIONS = [GameAction(x, y) for x in range(WIDTH) for y in range(WIDTH)]
 
+# _ROW_ACTIONS[x][row_bits] lists the actions of row x whose bit is set in row_bits
+_ROW_ACTIONS: List[List[Tuple[GameAction, ...]]] = [
+    [tuple([GameAction.ALL_ACTIONS[pos_to_idx(x, y)] for y in range(WIDTH) if (row_bits >> y) & 1]) for row_bits in range(1 << WIDTH)]
+    for x in range(WIDTH)
+]
+
+
+def mask_to_actions(mask: int) -> Tuple[GameAction, ...]:
+    actions = []
+    for x in range(WIDTH):
+        actions.extend(_ROW_ACTIONS[x][(mask >> (x * WIDTH)) & ROW_MASK])
+    return tuple(actions)
+
 
 class GameState:
     EMPTY_STATE: ClassVar["GameState"]
-    NEXT_STATE_MAP: ClassVar[Dict["GameState", Dict[GameAction, "GameState"]]]
-    
+
     def __init__(
-        self, 
-        board: Tuple[Tuple[int, ...], ...], 
-        next_player: int, 
-        last_move: GameAction, 
-        step: int, 
-        done: bool, 
-        winner: int
+        self,
+        black: int,
+        white: int,
+        next_player: int,
+        last_move: GameAction,
+        step: int,
+        done: bool,
+        winner: int,
+        key: int,
+        legal_mask: Optional[int] = None
     ):
-        self.board = board
+        # one bit per cell, see bitboard.pos_to_idx
+        self.black = black
+        self.white = white
         self.next_player = next_player
         self.last_move = last_move
         self.step = step
-        
+
         self.done = done
         self.winner = winner
-        self._init_next_legal_actions()
-        
-        
+        # 64-bit zobrist key of (black, white, next_player), maintained by Game.execute_action
+        self.key = key
+        self._board: Optional[Tuple[Tuple[int, ...], ...]] = None
+        self._init_next_legal_actions(legal_mask)
+
+
+    @classmethod
+    def from_board(
+        cls,
+        board: Tuple[Tuple[int, ...], ...],
+        next_player: int,
+        last_move: GameAction,
+        step: int,
+        done: bool,
+        winner: int
+    ) -> "GameState":
+        black, white = 0, 0
+        for x in range(WIDTH):
+            for y in range(WIDTH):
+                if board[x][y] == BLACK:
+                    black |= 1 << pos_to_idx(x, y)
+                elif board[x][y] == WHITE:
+                    white |= 1 << pos_to_idx(x, y)
+        return cls(black, white, next_player, last_move, step, done, winner, zobrist_key(black, white, next_player))
+
+
+    @property
+    def board(self) -> Tuple[Tuple[int, ...], ...]:
+        # tuple view for rendering and export, built on first access
+        if self._board is None:
+            self._board = bits_to_board(self.black, self.white)
+        return self._board
+
+
+    def get_stones(self, player: int) -> int:
+        return self.black if player == BLACK else self.white
+
+
     def __eq__(self, other):
         if not isinstance(other, GameState):
             return False
-        if self.board != other.board or self.next_player != other.next_player:
+        if self.key != other.key:
+            return False
+        if self.black != other.black or self.white != other.white or self.next_player != other.next_player:
             return False
         return True
 
 
     def __hash__(self):
-        return hash((self.board, self.next_player))
+        return self.key
 
-    
-    def _init_next_legal_actions(self):
+
+    def _init_next_legal_actions(self, legal_mask: Optional[int]):
+        # Game passes its incrementally kept mask, otherwise derive it from the stones
         if self.done:
-            self.legal_actions = tuple()
+            self.legal_mask = 0
+        elif legal_mask is None:
+            self.legal_mask = FULL_MASK & ~(self.black | self.white)
         else:
-            self.legal_actions = tuple([
-                action 
-                for action in GameAction.ALL_ACTIONS 
-                if self.board[action.x][action.y] == EMPTY
-            ])
-            
+            self.legal_mask = legal_mask
+        self._legal_actions: Optional[Tuple[GameAction, ...]] = None
+
+
+    @property
+    def legal_actions(self) -> Tuple[GameAction, ...]:
+        # GameAction objects are only built for callers that need them
+        if self._legal_actions is None:
+            self._legal_actions = mask_to_actions(self.legal_mask)
+        return self._legal_actions
+
+
+    @property
+    def legal_count(self) -> int:
+        return self.legal_mask.bit_count()
+
+
     def __repr__(self):
         board = self.board
         s = ""
@@ -80,89 +151,98 @@ class GameState:
         s += f"last move: ({self.last_move.x}, {self.last_move.y}). next player: {self.next_player}. done: {self.done}. winner: {self.winner}."
         return s
 
-    
+
 GameState.EMPTY_STATE = GameState(
-    tuple([tuple([EMPTY] * WIDTH) for _ in range(WIDTH)]), 
-    FIRST_PLAYER, 
-    GameAction.EMPTY_ACTION, 
-    0, False, EMPTY
+    0, 0,
+    FIRST_PLAYER,
+    GameAction.EMPTY_ACTION,
+    0, False, EMPTY,
+    zobrist_key(0, 0, FIRST_PLAYER)
 )
 
-GameState.NEXT_STATE_MAP = dict()
-
 
 # execute_action -> check -> (get_state) -> execute_action ->... -> execute_action -> check -> get_result
 class Game:
     def __init__(self, state: GameState=GameState.EMPTY_STATE):
         self._width: int = WIDTH
         self._win_len: int = WIN_LEN
-        self._total_cell_count: int = WIDTH * WIDTH
+        self._total_cell_count: int = CELL_COUNT
         self.load(state)
-        
-        
+
+
     def reset(self):
         self.load(GameState.EMPTY_STATE)
-        
-    
+
+
     def load(self, state: GameState):
-        self._board: List[List[int]] = [list(row) for row in state.board]
+        self._stones: Dict[int, int] = {BLACK: state.black, WHITE: state.white}
+        self._key = state.key
+        self._legal_mask = state.legal_mask
         self._player = state.next_player
         self._last_move = state.last_move
         self._step = state.step
-        
+
         self._done = state.done
         self._winner = state.winner
-        
+
         self._checked = True
-        
-    
+
+
     def get_current_player(self) -> int:
         return self._player
-        
-            
+
+
     def get_state(self) -> GameState:
         if not self._checked:
             raise ValueError("call get_state when game is not checked")
-        board = tuple(tuple(row) for row in self._board)
-        return GameState(board, self.get_current_player(), self._last_move, self._step, self._done, self._winner)
-    
-    
+        return GameState(self._stones[BLACK], self._stones[WHITE], self.get_current_player(), self._last_move, self._step, self._done, self._winner, self._key, self._legal_mask)
+
+
     def get_pos_state(self, x: int, y: int) -> int:
-        return self._board[x][y]
-            
-    
+        bit = 1 << pos_to_idx(x, y)
+        if self._stones[BLACK] & bit:
+            return BLACK
+        if self._stones[WHITE] & bit:
+            return WHITE
+        return EMPTY
+
+
     def is_action_legal(self, action: GameAction) -> bool:
         x, y = action.x, action.y
-        return (not self._done) and self.get_pos_state(x, y) == EMPTY
-    
-    
+        if self._done or not (0 <= x < self._width and 0 <= y < self._width):
+            return False
+        return (self._legal_mask >> action.idx) & 1 == 1
+
+
     def execute_action(self, action: GameAction) -> bool:
         if not self.is_action_legal(action):
             return False
-        x, y = action.x, action.y
-        self._board[x][y] = self.get_current_player()
+        self._stones[self._player] |= 1 << action.idx
+        self._key ^= ZOBRIST_KEYS[self._player][action.idx] ^ ZOBRIST_SIDE
+        self._legal_mask &= ~(1 << action.idx)
         self._last_move = action
         self._player *= -1
         self._step += 1
         self._checked = False
-        
+
         return True
-    
-    
+
+
     def get_result(self):
         if not self._checked:
             raise ValueError("call get_result when game is not checked")
         return (self._done, self._winner)
-        
-    
+
+
     def check(self, last_action: GameAction) -> bool:
         x, y = last_action.x, last_action.y
-        
+
         winner = self._check_win_based_on_idx(x, y)
         if winner != EMPTY:
             # somebody wins
             self._done = True
             self._winner = winner
+            self._legal_mask = 0
         elif self._check_draw():
             # draw
             self._done = True
@@ -173,38 +253,17 @@ class Game:
             self._winner = EMPTY
         self._checked = True
         return self._done
-            
-                    
+
+
     def _check_win_based_on_idx(self, x: int, y: int) -> int:
         player = self.get_pos_state(x, y)
         if player == EMPTY:
             return EMPTY
-        # check 4 directions
-        dirs = [(1,0),(0,1),(1,1),(1,-1)]
-        for dx, dy in dirs:
-            cnt = 1
-            # forward
-            i = 1
-            while True:
-                nx, ny = x + dx*i, y + dy*i
-                if 0 <= nx < self._width and 0 <= ny < self._width and self.get_pos_state(nx, ny) == player:
-                    cnt += 1
-                    i += 1
-                else:
-                    break
-            # backward
-            i = 1
-            while True:
-                nx, ny = x - dx*i, y - dy*i
-                if 0 <= nx < self._width and 0 <= ny < self._width and self.get_pos_state(nx, ny) == player:
-                    cnt += 1
-                    i += 1
-                else:
-                    break
-            if cnt >= self._win_len:
-                return player
+        # only the stones of the player on (x, y) can have formed a new five
+        if has_five(self._stones[player]):
+            return player
         return EMPTY
-    
-    
+
+
     def _check_draw(self) -> bool:
-        return self._step == self._total_cell_count
\ No newline at end of file
+        return self._legal_mask == 0
@@ -1,11 +1,23 @@
 from constant import EMPTY, WIDTH, WIN_LEN
 from game import GameState
+from bitboard import pos_to_idx, idx_to_pos, iter_bits
+from eval_cache import EvalCache
+from symmetry import INVERSE_SYMMETRIES, symmetric_keys, transform_mask
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+
+import hashlib
+import json
+
+
+def config_fingerprint(heuristic_config) -> str:
+    # heuristics with different weights must not share cache entries
+    text = json.dumps(heuristic_config, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
 
 
 class Heuristic:
-    def __init__(self, heuristic_config):
+    def __init__(self, heuristic_config, cache: Optional[EvalCache]=None):
         self.width = WIDTH
         self.win_len = WIN_LEN
         self.directions = [(0,1), (1,0), (1,1), (-1,1)]
@@ -18,6 +30,10 @@ class Heuristic:
         
         self.immediate_win_weight = heuristic_config['immediate_win_weight']
         
+        # entries are keyed by (fingerprint, position key), so one cache can serve several configs
+        self.cache = cache
+        self.fingerprint = config_fingerprint(heuristic_config)
+        
     
     def cal_left_to_right(self, board, player):
         ans_2 = [[0] * self.width for _ in range(self.width)]
@@ -247,7 +263,7 @@ class Heuristic:
                         continue
                     
                     prev_end_x, prev_end_y = prev_x - dx * prev_length, prev_y - dy * prev_length
-                    next_end_x, next_end_y = next_x + dx * next_length, next_y + dx * next_length
+                    next_end_x, next_end_y = next_x + dx * next_length, next_y + dy * next_length
                     
                     prev_empty = self.is_empty(board, prev_end_x, prev_end_y)
                     next_empty = self.is_empty(board, next_end_x, next_end_y)
@@ -385,14 +401,76 @@ class Heuristic:
         return value
         
 
+    def clear_cache(self) -> None:
+        # forgets every cached evaluation, e.g. to time a cold one
+        if self.cache is not None:
+            self.cache.clear()
+
+
     def estimate_value(self, state: GameState) -> Tuple[float, List[Tuple[int, int]]]:      
         if state.done:
             return 0.0, []
-        
-        board = state.board
-        player = state.next_player
-    # def estimate_value(self, board, player) -> float:        
-        
+        cache = self.cache
+        if cache is None:
+            value, important_mask = self.evaluate_state(state)
+        elif cache.symmetric:
+            # the entry of the canonical image, its important positions are mapped between the two boards
+            keys = symmetric_keys(state.black, state.white, state.next_player)
+            s = keys.index(min(keys))
+            cache_key = (self.fingerprint, keys[s])
+            entry = cache.get(cache_key, state.step)
+            if entry is None:
+                value, important_mask = self.evaluate_state(state)
+                cache.put(cache_key, (value, transform_mask(important_mask, s)), state.step)
+            else:
+                value, important_mask = entry[0], transform_mask(entry[1], INVERSE_SYMMETRIES[s])
+            if s != 0:
+                # evaluate_rollout looks the same board up by its own key
+                cache.put((self.fingerprint, state.key), (value, important_mask))
+        else:
+            cache_key = (self.fingerprint, state.key)
+            entry = cache.get(cache_key, state.step)
+            if entry is None:
+                entry = self.evaluate_state(state)
+                cache.put(cache_key, entry, state.step)
+            value, important_mask = entry
+        return value, [idx_to_pos(idx) for idx in iter_bits(important_mask)]
+    
+    
+    def make_tracker(self, state: GameState):
+        # incremental backends return an object that follows RolloutBoard moves via place(idx, player) / remove(idx, player)
+        return None
+    
+    
+    def evaluate_rollout(self, rollout_board) -> Tuple[float, int]:
+        # rollout_board is a rollout.RolloutBoard, its tracker comes from make_tracker
+        cache = self.cache
+        if cache is None:
+            return self.evaluate_position(rollout_board.board, rollout_board.player, rollout_board.tracker)
+        cache_key = (self.fingerprint, rollout_board.key)
+        entry = cache.get(cache_key)
+        if entry is None:
+            entry = self.evaluate_position(rollout_board.board, rollout_board.player, rollout_board.tracker)
+            cache.put(cache_key, entry)
+        return entry
+    
+    
+    def evaluate_state(self, state: GameState) -> Tuple[float, int]:
+        # uncached, for a state that is not done
+        return self.evaluate_position(state.board, state.next_player, None)
+    
+    
+    def evaluate_position(self, board, player, tracker) -> Tuple[float, int]:
+        # uncached evaluate with the important positions as a bitmask
+        value, important_pos_list = self.evaluate(board, player)
+        important_mask = 0
+        for x, y in important_pos_list:
+            important_mask |= 1 << pos_to_idx(x, y)
+        return value, important_mask
+    
+    
+    def evaluate(self, board, player) -> Tuple[float, List[Tuple[int, int]]]:
+        # board only needs board[x][y], so callers can pass a mutable List[List[int]]
         opponent = player * -1
         
         player_all_length_dict = self.cal_all_length(board, player)
@@ -435,6 +513,22 @@ class Heuristic:
         return (ad_value * self.advantage_weight + empty_ad_value * self.empty_advantage_weight) * self.immediate_win_weight, important_pos_list
     
 
+def make_heuristic(heuristic_config, backend: str="python", cache: Optional[EvalCache]=None, pattern_cache_bytes: Optional[int]=None) -> Heuristic:
+    # pattern_cache_bytes: see IncrementalHeuristic, None for HEURISTIC_PATTERN_CACHE_BYTES
+    if backend == "python":
+        return Heuristic(heuristic_config, cache)
+    if backend == "numpy":
+        # numpy is only needed for this backend
+        from heuristic_numpy import NumpyHeuristic
+        return NumpyHeuristic(heuristic_config, cache)
+    if backend == "incremental":
+        from heuristic_incremental import IncrementalHeuristic
+        if pattern_cache_bytes is None:
+            return IncrementalHeuristic(heuristic_config, cache)
+        return IncrementalHeuristic(heuristic_config, cache, pattern_cache_bytes)
+    raise ValueError(f"unknown heuristic backend: {backend}")
+
+
 def print_matrix(matrix):
     print("--------------------------------")
     for row in matrix:
@@ -0,0 +1,328 @@
+from constant import EMPTY, BLACK, WHITE, WIDTH, HEURISTIC_PATTERN_CACHE_BYTES
+from heuristic import Heuristic
+from eval_cache import EvalCache
+from game import GameState
+from bitboard import ZOBRIST_KEYS, ZOBRIST_SIDE, pos_to_idx, idx_to_pos, iter_bits
+from line_table import LINE_TABLE, POW3, COLOR_DIGIT, KINDS, N_CODES, pattern_code
+
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Optional
+
+import sys
+
+
+def _build_lines(directions: List[Tuple[int, int]]) -> Tuple[List[List[int]], List[List[Tuple[int, int]]]]:
+    # lines[l] lists the cells of line l in direction order, cell_lines[idx] the (line, position) pairs through idx
+    # lines shorter than 2 cells can never hold a pattern and are left out
+    lines: List[List[int]] = []
+    cell_lines: List[List[Tuple[int, int]]] = [[] for _ in range(WIDTH * WIDTH)]
+    for dx, dy in directions:
+        for x in range(WIDTH):
+            for y in range(WIDTH):
+                px, py = x - dx, y - dy
+                if 0 <= px < WIDTH and 0 <= py < WIDTH:
+                    continue
+                line = []
+                cx, cy = x, y
+                while 0 <= cx < WIDTH and 0 <= cy < WIDTH:
+                    line.append(pos_to_idx(cx, cy))
+                    cx, cy = cx + dx, cy + dy
+                if len(line) < 2:
+                    continue
+                for pos, idx in enumerate(line):
+                    cell_lines[idx].append((len(lines), pos))
+                lines.append(line)
+    return lines, cell_lines
+
+
+LINES, CELL_LINES = _build_lines([(0,1), (1,0), (1,1), (-1,1)])
+
+
+class LinePatterns:
+    # per-line pattern statistics of one position, with running totals over all lines
+    def __init__(self, codes: List[int]):
+        n_lines = len(LINES)
+        n_codes = N_CODES
+        self.codes: List[int] = codes
+        self.stats: List[Tuple] = [()] * n_lines
+        self.run_totals: Dict[int, List[int]] = {BLACK: [0] * n_codes, WHITE: [0] * n_codes}
+        self.empty_totals: Dict[int, List[int]] = {BLACK: [0] * n_codes, WHITE: [0] * n_codes}
+        # board bitmasks per line
+        self.important: List[int] = [0] * n_lines
+        self.four_half: Dict[int, List[int]] = {BLACK: [0] * n_lines, WHITE: [0] * n_lines}
+        self.three_both: Dict[int, List[int]] = {BLACK: [0] * n_lines, WHITE: [0] * n_lines}
+        for line_id, line in enumerate(LINES):
+            self._add_line(line_id)
+
+
+    @classmethod
+    def from_state(cls, state: GameState) -> "LinePatterns":
+        codes = [0] * len(LINES)
+        for player in (BLACK, WHITE):
+            digit = COLOR_DIGIT[player]
+            for idx in iter_bits(state.get_stones(player)):
+                for line_id, pos in CELL_LINES[idx]:
+                    codes[line_id] += digit * POW3[pos]
+        return cls(codes)
+
+
+    def copy(self) -> "LinePatterns":
+        other = LinePatterns.__new__(LinePatterns)
+        other.codes = self.codes.copy()
+        other.stats = self.stats.copy()
+        other.run_totals = {color: totals.copy() for color, totals in self.run_totals.items()}
+        other.empty_totals = {color: totals.copy() for color, totals in self.empty_totals.items()}
+        other.important = self.important.copy()
+        other.four_half = {color: masks.copy() for color, masks in self.four_half.items()}
+        other.three_both = {color: masks.copy() for color, masks in self.three_both.items()}
+        return other
+
+
+    def place(self, idx: int, player: int) -> None:
+        digit = COLOR_DIGIT[player]
+        for line_id, pos in CELL_LINES[idx]:
+            self._remove_line(line_id)
+            self.codes[line_id] += digit * POW3[pos]
+            self._add_line(line_id)
+
+
+    def remove(self, idx: int, player: int) -> None:
+        digit = COLOR_DIGIT[player]
+        for line_id, pos in CELL_LINES[idx]:
+            self._remove_line(line_id)
+            self.codes[line_id] -= digit * POW3[pos]
+            self._add_line(line_id)
+
+
+    def _add_line(self, line_id: int) -> None:
+        line = LINES[line_id]
+        stats = LINE_TABLE[len(line)][self.codes[line_id]]
+        self.stats[line_id] = stats
+        important = 0
+        for color, (run_counts, empty_counts, important_pos, four_half_pos, three_both_pos) in zip((BLACK, WHITE), stats):
+            run_totals = self.run_totals[color]
+            for code, count in run_counts:
+                run_totals[code] += count
+            empty_totals = self.empty_totals[color]
+            for code, count in empty_counts:
+                empty_totals[code] += count
+            important |= important_pos
+            self.four_half[color][line_id] = _spread(line, four_half_pos)
+            self.three_both[color][line_id] = _spread(line, three_both_pos)
+        self.important[line_id] = _spread(line, important)
+
+
+    def _remove_line(self, line_id: int) -> None:
+        for color, (run_counts, empty_counts, _, _, _) in zip((BLACK, WHITE), self.stats[line_id]):
+            run_totals = self.run_totals[color]
+            for code, count in run_counts:
+                run_totals[code] -= count
+            empty_totals = self.empty_totals[color]
+            for code, count in empty_counts:
+                empty_totals[code] -= count
+
+
+    def nbytes(self) -> int:
+        # the lists and ints owned by this object; the stats tuples are shared with LINE_TABLE, small ints with the interpreter
+        total = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        for values in [self.codes, self.stats, self.important]:
+            total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values if isinstance(v, int) and not -5 <= v <= 256)
+        for per_color in [self.run_totals, self.empty_totals, self.four_half, self.three_both]:
+            total += sys.getsizeof(per_color)
+            for values in per_color.values():
+                total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values if not -5 <= v <= 256)
+        return total
+
+
+    def important_mask(self) -> int:
+        mask = 0
+        for line_mask in self.important:
+            mask |= line_mask
+        return mask
+
+
+def _spread(line: List[int], pos_mask: int) -> int:
+    # line positions -> board bits
+    mask = 0
+    while pos_mask:
+        low = pos_mask & -pos_mask
+        mask |= 1 << line[low.bit_length() - 1]
+        pos_mask ^= low
+    return mask
+
+
+def _has_double(masks: List[int]) -> bool:
+    # some bit is set in at least two of the masks
+    seen = 0
+    for mask in masks:
+        if seen & mask:
+            return True
+        seen |= mask
+    return False
+
+
+class IncrementalHeuristic(Heuristic):
+    # same evaluation as Heuristic, derived from pattern counts kept per line
+    # a move only looks up the row, column and two diagonals through it in line_table.LINE_TABLE
+    def __init__(self, heuristic_config, cache: Optional[EvalCache]=None, max_pattern_bytes: int=HEURISTIC_PATTERN_CACHE_BYTES):
+        super().__init__(heuristic_config, cache)
+        self.advantage_codes = self.title_codes(self.advantage_weight_dict)
+        self.empty_advantage_codes = self.title_codes(self.empty_advantage_weight_dict)
+
+        # side structure keyed by GameState.key, a child is derived from its parent when possible.
+        # LRU bounded by max_pattern_bytes, the entry size is measured on the first entry: all have the same layout
+        if max_pattern_bytes <= 0:
+            raise ValueError("IncrementalHeuristic: max_pattern_bytes must be positive.")
+        self.max_pattern_bytes = max_pattern_bytes
+        self.max_cached_states: Optional[int] = None
+        self._patterns: "OrderedDict[int, LinePatterns]" = OrderedDict()
+
+
+    def code(self, length: int, kind: str) -> int:
+        return pattern_code(length, kind)
+
+
+    def title_codes(self, weight_dict) -> List[Tuple[int, int]]:
+        win_len = self.win_len
+        title_codes = {
+            "both_n2": self.code(win_len-2, 'both'),
+            "half_n1": self.code(win_len-1, 'half'),
+            "both_n3": self.code(win_len-3, 'both'),
+            "half_n2": self.code(win_len-2, 'half'),
+            "half_n3": self.code(win_len-3, 'half')
+        }
+        return [(code, weight_dict[title]) for title, code in title_codes.items() if title in weight_dict]
+
+
+    def get_patterns(self, state: GameState) -> LinePatterns:
+        patterns = self._patterns.get(state.key)
+        if patterns is not None:
+            self._patterns.move_to_end(state.key)
+            return patterns
+        last_move = state.last_move
+        last_player = -state.next_player
+        parent = None
+        if last_move.idx >= 0 and (state.get_stones(last_player) >> last_move.idx) & 1:
+            parent_key = state.key ^ ZOBRIST_KEYS[last_player][last_move.idx] ^ ZOBRIST_SIDE
+            parent = self._patterns.get(parent_key)
+        if parent is not None:
+            patterns = parent.copy()
+            patterns.place(last_move.idx, last_player)
+        else:
+            patterns = LinePatterns.from_state(state)
+        if self.max_cached_states is None:
+            # plus the dict slot and the key
+            self.max_cached_states = max(1, self.max_pattern_bytes // (patterns.nbytes() + 100))
+        self._patterns[state.key] = patterns
+        if len(self._patterns) > self.max_cached_states:
+            self._patterns.popitem(last=False)
+        return patterns
+
+
+    def clear_cache(self) -> None:
+        super().clear_cache()
+        self._patterns.clear()
+
+
+    def evaluate_state(self, state: GameState) -> Tuple[float, int]:
+        return self.evaluate_patterns(self.get_patterns(state), state.next_player)
+
+
+    def evaluate(self, board, player) -> Tuple[float, List[Tuple[int, int]]]:
+        state = GameState.from_board(board, player, GameState.EMPTY_STATE.last_move, 0, False, EMPTY)
+        value, important_mask = self.evaluate_patterns(LinePatterns.from_state(state), player)
+        return value, [idx_to_pos(idx) for idx in iter_bits(important_mask)]
+
+
+    def make_tracker(self, state: GameState) -> Optional[LinePatterns]:
+        return self.get_patterns(state).copy()
+
+
+    def evaluate_position(self, board, player, tracker) -> Tuple[float, int]:
+        if tracker is None:
+            return super().evaluate_position(board, player, tracker)
+        return self.evaluate_patterns(tracker, player)
+
+
+    def evaluate_patterns(self, patterns: LinePatterns, player: int) -> Tuple[float, int]:
+        # the checks of Heuristic.evaluate in the same order, on the line totals
+        win_len = self.win_len
+        code = self.code
+        opponent = -player
+        important_mask = patterns.important_mask()
+        player_runs, opponent_runs = patterns.run_totals[player], patterns.run_totals[opponent]
+        player_empty, opponent_empty = patterns.empty_totals[player], patterns.empty_totals[opponent]
+
+        fives = [code(win_len, kind) for kind in KINDS]
+        if any(player_runs[c] >= 1 for c in fives):
+            return 1.0, important_mask
+        if any(opponent_runs[c] >= 1 for c in fives):
+            return -1.0, important_mask
+        if self.player_is_immediate_win_patterns(patterns, player):
+            return self.immediate_win_weight, important_mask
+        if opponent_runs[code(win_len-1, 'both')] >= 1:
+            return -self.immediate_win_weight, important_mask
+
+        player_ad_value = float(sum(player_runs[c] * w for c, w in self.advantage_codes))
+        opponent_ad_value = float(sum(opponent_runs[c] * w for c, w in self.advantage_codes))
+        ad_value = 0
+        if player_ad_value + opponent_ad_value != 0:
+            ad_value = (player_ad_value - opponent_ad_value) / (player_ad_value + opponent_ad_value)
+
+        player_empty_ad_value = float(sum(player_empty[c] * w for c, w in self.empty_advantage_codes))
+        opponent_empty_ad_value = float(sum(opponent_empty[c] * w for c, w in self.empty_advantage_codes))
+        empty_ad_value = 0
+        if player_empty_ad_value + opponent_empty_ad_value != 0:
+            empty_ad_value = (player_empty_ad_value - opponent_empty_ad_value) / (player_empty_ad_value + opponent_empty_ad_value)
+
+        return (ad_value * self.advantage_weight + empty_ad_value * self.empty_advantage_weight) * self.immediate_win_weight, important_mask
+
+
+    def player_is_immediate_win_patterns(self, patterns: LinePatterns, player: int) -> bool:
+        win_len = self.win_len
+        code = self.code
+        runs, empty = patterns.run_totals[player], patterns.empty_totals[player]
+        # .oooo. & .ooooX
+        if runs[code(win_len-1, 'both')] >= 1 or runs[code(win_len-1, 'half')] >= 1:
+            return True
+        # .ooo.
+        if runs[code(win_len-2, 'both')] >= 1:
+            return True
+        # some empty cell completes five, or makes .oooo.
+        if any(empty[code(win_len, kind)] >= 1 for kind in KINDS) or empty[code(win_len-1, 'both')] >= 1:
+            return True
+        # (.ooooX, .ooooX) and (.ooo., .ooo.) on one empty cell
+        if empty[code(win_len-1, 'half')] >= 2 and _has_double(patterns.four_half[player]):
+            return True
+        if empty[code(win_len-2, 'both')] >= 2 and _has_double(patterns.three_both[player]):
+            return True
+        return False
+
+
+if __name__ == "__main__":
+    # differential check against the pure-Python Heuristic
+    from constant import HEURISTIC_CFG
+    from game import Game
+    import random
+
+    python_heuristic = Heuristic(HEURISTIC_CFG)
+    incremental_heuristic = IncrementalHeuristic(HEURISTIC_CFG)
+    rnd = random.Random(0)
+    n_checked = 0
+    for i in range(300):
+        game = Game()
+        state = game.get_state()
+        while not state.done:
+            expected = python_heuristic.estimate_value(state)
+            actual = incremental_heuristic.estimate_value(state)
+            if expected[0] != actual[0] or sorted(expected[1]) != sorted(actual[1]):
+                print(state)
+                print(f"python: {expected}")
+                print(f"incremental: {actual}")
+                raise AssertionError("incremental heuristic differs from python heuristic")
+            n_checked += 1
+            action = rnd.choice(state.legal_actions)
+            game.execute_action(action)
+            game.check(action)
+            state = game.get_state()
+    print(f"{n_checked} positions match")
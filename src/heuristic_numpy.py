@@ -0,0 +1,280 @@
+from constant import EMPTY, WIDTH
+from heuristic import Heuristic
+from eval_cache import EvalCache
+
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+
+def _build_line_tables(directions: List[Tuple[int, int]], width: int) -> Tuple[np.ndarray, np.ndarray]:
+    # line_cells[l] lists the cells of line l in direction order, padded with the sentinel cell width*width
+    # cell_slots[d, c] is the position of cell c inside line_cells.ravel() for direction d
+    sentinel = width * width
+    lines = []
+    cell_slots = np.zeros((len(directions), width * width), dtype=np.int64)
+    for d, (dx, dy) in enumerate(directions):
+        for x in range(width):
+            for y in range(width):
+                px, py = x - dx, y - dy
+                if 0 <= px < width and 0 <= py < width:
+                    continue
+                # (x, y) starts a line
+                line = []
+                cx, cy = x, y
+                while 0 <= cx < width and 0 <= cy < width:
+                    cell_slots[d, cx * width + cy] = len(lines) * width + len(line)
+                    line.append(cx * width + cy)
+                    cx, cy = cx + dx, cy + dy
+                lines.append(line + [sentinel] * (width - len(line)))
+    return np.array(lines, dtype=np.int64), cell_slots
+
+
+class NumpyHeuristic(Heuristic):
+    # same evaluation as Heuristic, computed for all cells, directions and both colours with array ops
+    def __init__(self, heuristic_config, cache: Optional[EvalCache]=None):
+        super().__init__(heuristic_config, cache)
+        width = self.width
+        self.n_lengths = self.win_len - 1       # run lengths 2..win_len
+        self.n_codes = self.n_lengths * 3       # x (both, half, close)
+
+        self.line_cells, self.cell_slots = _build_line_tables(self.directions, width)
+        cells = np.arange(width * width)
+        self.cell_x = cells // width
+        self.cell_y = cells % width
+        self.dir_x = np.array([dx for dx, _ in self.directions]).reshape(-1, 1)
+        self.dir_y = np.array([dy for _, dy in self.directions]).reshape(-1, 1)
+        self.dir_idx = np.arange(len(self.directions)).reshape(-1, 1)
+        self.prev_cells = self.flat_index(self.cell_x - self.dir_x, self.cell_y - self.dir_y)
+        self.next_cells = self.flat_index(self.cell_x + self.dir_x, self.cell_y + self.dir_y)
+        # ray_cells[d, c, width + 1 + k] is the cell k steps from c along direction d, or the sentinel
+        steps = np.arange(-(width + 1), width + 2).reshape(1, 1, -1)
+        self.ray_cells = self.flat_index(self.cell_x.reshape(1, -1, 1) + self.dir_x.reshape(-1, 1, 1) * steps,
+                                         self.cell_y.reshape(1, -1, 1) + self.dir_y.reshape(-1, 1, 1) * steps)
+        self.cell_idx = cells
+
+        self.advantage_weights = self.weight_vector(self.advantage_weight_dict)
+        self.empty_advantage_weights = self.weight_vector(self.empty_advantage_weight_dict)
+
+        win_len = self.win_len
+        self.five_codes = [self.code(win_len, kind) for kind in ['both', 'half', 'close']]
+        self.important_codes = (
+            [self.code(i, 'both') for i in range(max(2, win_len-3), win_len+1)]
+            + [self.code(i, 'half') for i in range(max(2, win_len-2), win_len+1)]
+            + [self.code(win_len, 'close')]
+        )
+
+
+    def code(self, length: int, kind: str) -> int:
+        return (length - 2) * 3 + ['both', 'half', 'close'].index(kind)
+
+
+    def weight_vector(self, weight_dict) -> np.ndarray:
+        win_len = self.win_len
+        title_codes = {
+            "both_n2": self.code(win_len-2, 'both'),
+            "half_n1": self.code(win_len-1, 'half'),
+            "both_n3": self.code(win_len-3, 'both'),
+            "half_n2": self.code(win_len-2, 'half'),
+            "half_n3": self.code(win_len-3, 'half')
+        }
+        weights = np.zeros(self.n_codes, dtype=np.int64)
+        for title, code in title_codes.items():
+            if title in weight_dict:
+                weights[code] = weight_dict[title]
+        return weights
+
+
+    def flat_index(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # off-board cells map to the sentinel, which is neither a stone nor empty
+        width = self.width
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < width)
+        return np.where(inside, x * width + y, width * width)
+
+
+    def ray_cell(self, steps: np.ndarray) -> np.ndarray:
+        # steps (C, 4, width*width) -> the cell that many steps from every cell along every direction
+        return self.ray_cells[self.dir_idx, self.cell_idx, steps + self.width + 1]
+
+
+    def cal_all_length_batch(self, stones: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # stones: (C, width*width+1) bool with the sentinel last -> ans1, ans2 as (C, 4, width*width+1)
+        width = self.width
+        n_color = stones.shape[0]
+        line_stones = stones[:, self.line_cells]
+        pos = np.arange(width)
+        last_block = np.maximum.accumulate(np.where(line_stones, -1, pos), axis=-1)
+        next_block = np.minimum.accumulate(np.where(line_stones, width, pos)[..., ::-1], axis=-1)[..., ::-1]
+        ans2 = (pos - last_block).reshape(n_color, -1)[:, self.cell_slots]
+        ans1 = (next_block - pos).reshape(n_color, -1)[:, self.cell_slots]
+        pad = np.zeros((n_color, len(self.directions), 1), dtype=ans1.dtype)
+        return np.concatenate([ans1, pad], axis=-1), np.concatenate([ans2, pad], axis=-1)
+
+
+    def cal_open_counts_batch(self, stones: np.ndarray, empty: np.ndarray, ans1: np.ndarray, ans2: np.ndarray):
+        n_cell = self.width * self.width
+        rows = np.arange(stones.shape[0]).reshape(-1, 1, 1)
+        length1, length2 = ans1[..., :n_cell], ans2[..., :n_cell]
+
+        # runs, counted once at their first stone
+        is_start = (length2 == 1) & (length1 >= 2)
+        next_cells = self.ray_cell(length1)
+        prev_empty = empty[rows, self.prev_cells]
+        next_empty = empty[rows, next_cells]
+        run_codes = self.classify(length1, prev_empty, next_empty, is_start)
+        open_counts = self.count_codes(run_codes.reshape(stones.shape[0], -1))
+
+        # runs that an extra stone on each empty cell would create
+        prev_length = ans2[rows, self.dir_idx, self.prev_cells]
+        next_length = ans1[rows, self.dir_idx, self.next_cells]
+        new_length = prev_length + next_length + 1
+        is_new = empty[:, None, :n_cell] & (new_length > 1)
+        prev_end_cells = self.ray_cell(-(prev_length + 1))
+        next_end_cells = self.ray_cell(next_length + 1)
+        prev_empty = empty[rows, prev_end_cells]
+        next_empty = empty[rows, next_end_cells]
+        empty_codes = self.classify(new_length, prev_empty, next_empty, is_new)
+        # (C, cells, codes)
+        empty_cell_counts = self.count_codes(empty_codes.transpose(0, 2, 1))
+        return open_counts, empty_cell_counts
+
+
+    def classify(self, length: np.ndarray, prev_empty: np.ndarray, next_empty: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        length = np.minimum(length, self.win_len)
+        codes = (length - 2) * 3 + 2 - prev_empty.astype(np.int64) - next_empty.astype(np.int64)
+        return np.where(valid, codes, -1)
+
+
+    def count_codes(self, codes: np.ndarray) -> np.ndarray:
+        # codes (..., n) -> occurrences of every code (..., n_codes), -1 is ignored
+        n_group = codes[..., 0].size
+        offsets = (np.arange(n_group) * (self.n_codes + 1)).reshape(codes.shape[:-1] + (1,))
+        counts = np.bincount((codes + 1 + offsets).ravel(), minlength=n_group * (self.n_codes + 1))
+        return counts.reshape(codes.shape[:-1] + (self.n_codes + 1,))[..., 1:]
+
+
+    def evaluate_batch(self, boards: np.ndarray, players: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # boards (K, width, width), players (K,) -> values (K,), important positions as a (K, width, width) bool mask
+        win_len = self.win_len
+        n_board = boards.shape[0]
+        flat = boards.reshape(n_board, -1)
+        colors = np.concatenate([players, -players]).reshape(-1, 1)
+        flat = np.concatenate([flat, flat])
+        sentinel = np.zeros((2 * n_board, 1), dtype=bool)
+        stones = np.concatenate([flat == colors, sentinel], axis=1)
+        empty = np.concatenate([flat == EMPTY, sentinel], axis=1)
+
+        ans1, ans2 = self.cal_all_length_batch(stones)
+        open_counts, empty_cell_counts = self.cal_open_counts_batch(stones, empty, ans1, ans2)
+
+        code = self.code
+        important = (empty_cell_counts[..., self.important_codes] > 0).any(axis=-1)
+        important = (important[:n_board] | important[n_board:]).reshape(boards.shape)
+
+        player_open, opponent_open = open_counts[:n_board], open_counts[n_board:]
+        player_cell = empty_cell_counts[:n_board]
+        fives = self.five_codes
+        player_already_win = (player_open[:, fives] >= 1).any(axis=-1)
+        opponent_already_win = (opponent_open[:, fives] >= 1).any(axis=-1)
+        player_immediate_win = (
+            (player_open[:, code(win_len-1, 'both')] >= 1) | (player_open[:, code(win_len-1, 'half')] >= 1)
+            | (player_open[:, code(win_len-2, 'both')] >= 1)
+            | ((player_cell[..., fives] >= 1).any(axis=-1)
+               | (player_cell[..., code(win_len-1, 'both')] >= 1)
+               | (player_cell[..., code(win_len-1, 'half')] >= 2)
+               | (player_cell[..., code(win_len-2, 'both')] >= 2)).any(axis=-1)
+        )
+        opponent_immediate_win = opponent_open[:, code(win_len-1, 'both')] >= 1
+
+        ad = open_counts @ self.advantage_weights
+        empty_ad = empty_cell_counts.sum(axis=1) @ self.empty_advantage_weights
+        ad_value = self.advantage_ratio(ad[:n_board], ad[n_board:])
+        empty_ad_value = self.advantage_ratio(empty_ad[:n_board], empty_ad[n_board:])
+
+        values = (ad_value * self.advantage_weight + empty_ad_value * self.empty_advantage_weight) * self.immediate_win_weight
+        values = np.where(opponent_immediate_win, -self.immediate_win_weight, values)
+        values = np.where(player_immediate_win, self.immediate_win_weight, values)
+        values = np.where(opponent_already_win, -1.0, values)
+        values = np.where(player_already_win, 1.0, values)
+        return values, important
+
+
+    def important_batch(self, boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+        # the important mask of evaluate_batch without the value, with whole-board shifts instead of gathers:
+        # for every empty cell and direction, the runs of one colour that end next to it on both sides.
+        # Runs are counted up to win_len-1 stones, a longer one makes the cell important anyway
+        win_len = self.win_len
+        width = self.width
+        pad = win_len
+        n_board = boards.shape[0]
+        colors = np.concatenate([players, -players]).reshape(-1, 1, 1)
+        doubled = np.concatenate([boards, boards])
+        stones = np.zeros((2 * n_board, width + 2 * pad, width + 2 * pad), dtype=bool)
+        empty = np.zeros_like(stones)
+        stones[:, pad:pad + width, pad:pad + width] = doubled == colors
+        empty[:, pad:pad + width, pad:pad + width] = doubled == EMPTY
+
+        def shifted(a: np.ndarray, dx: int, dy: int) -> np.ndarray:
+            return a[:, pad + dx:pad + dx + width, pad + dy:pad + dy + width]
+
+        important = np.zeros((2 * n_board, width, width), dtype=bool)
+        for dx, dy in self.directions:
+            lengths = []
+            n_open = np.zeros((2 * n_board, width, width), dtype=np.int8)
+            for sign in (1, -1):
+                run = np.ones((2 * n_board, width, width), dtype=bool)
+                length = np.zeros((2 * n_board, width, width), dtype=np.int8)
+                for k in range(1, win_len):
+                    run &= shifted(stones, sign * dx * k, sign * dy * k)
+                    length += run
+                # the cell right after the run
+                for k in range(1, win_len):
+                    n_open += (length == k - 1) & shifted(empty, sign * dx * k, sign * dy * k)
+                lengths.append(length)
+            new_length = np.minimum(lengths[0] + lengths[1] + 1, win_len)
+            # the lengths and kinds of important_codes
+            important |= (new_length > 1) & (
+                (new_length >= win_len) | ((new_length >= win_len - 2) & (n_open >= 1)) | ((new_length >= win_len - 3) & (n_open == 2)))
+        important &= shifted(empty, 0, 0)
+        return important[:n_board] | important[n_board:]
+
+
+    def advantage_ratio(self, player_value: np.ndarray, opponent_value: np.ndarray) -> np.ndarray:
+        total = player_value + opponent_value
+        return np.where(total != 0, (player_value - opponent_value) / np.where(total != 0, total, 1), 0.0)
+
+
+    def evaluate(self, board, player) -> Tuple[float, List[Tuple[int, int]]]:
+        boards = np.asarray(board, dtype=np.int8).reshape(1, self.width, self.width)
+        values, important = self.evaluate_batch(boards, np.array([player], dtype=np.int8))
+        xs, ys = np.nonzero(important[0])
+        return float(values[0]), [(int(x), int(y)) for x, y in zip(xs, ys)]
+
+
+if __name__ == "__main__":
+    # differential check against the pure-Python Heuristic
+    from constant import HEURISTIC_CFG
+    from game import Game
+    import random
+
+    python_heuristic = Heuristic(HEURISTIC_CFG)
+    numpy_heuristic = NumpyHeuristic(HEURISTIC_CFG)
+    rnd = random.Random(0)
+    n_checked = 0
+    for i in range(300):
+        game = Game()
+        state = game.get_state()
+        while not state.done:
+            expected = python_heuristic.estimate_value(state)
+            actual = numpy_heuristic.estimate_value(state)
+            if expected[0] != actual[0] or sorted(expected[1]) != sorted(actual[1]):
+                print(state)
+                print(f"python: {expected}")
+                print(f"numpy: {actual}")
+                raise AssertionError("numpy heuristic differs from python heuristic")
+            n_checked += 1
+            action = rnd.choice(state.legal_actions)
+            game.execute_action(action)
+            game.check(action)
+            state = game.get_state()
+    print(f"{n_checked} positions match")
@@ -0,0 +1,130 @@
+from constant import EMPTY, BLACK, WHITE, WIDTH, WIN_LEN
+
+from typing import List, Tuple, Dict
+
+import os
+import pickle
+
+
+# a line is encoded in base 3, one digit per cell: EMPTY -> 0, BLACK -> 1, WHITE -> 2
+POW3: List[int] = [3 ** i for i in range(WIDTH)]
+COLOR_DIGIT: Dict[int, int] = {BLACK: 1, WHITE: 2}
+DIGIT_COLOR: List[int] = [EMPTY, BLACK, WHITE]
+
+# run lengths 2..WIN_LEN (longer runs count as WIN_LEN) x (both, half, close) open ends
+KINDS: List[str] = ['both', 'half', 'close']
+N_CODES: int = (WIN_LEN - 1) * 3
+
+# bump when the layout of the table entries changes
+TABLE_VERSION: int = 1
+CACHE_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache")
+
+
+def pattern_code(length: int, kind: str) -> int:
+    return (min(length, WIN_LEN) - 2) * 3 + KINDS.index(kind)
+
+
+IMPORTANT_CODES = frozenset(
+    [pattern_code(i, 'both') for i in range(max(2, WIN_LEN-3), WIN_LEN+1)]
+    + [pattern_code(i, 'half') for i in range(max(2, WIN_LEN-2), WIN_LEN+1)]
+    + [pattern_code(WIN_LEN, 'close')]
+)
+FOUR_HALF_CODE: int = pattern_code(WIN_LEN-1, 'half')
+THREE_BOTH_CODE: int = pattern_code(WIN_LEN-2, 'both')
+
+
+def scan_line(cells: List[int], color: int) -> Tuple:
+    # Heuristic.cal_open_dict and cal_empty_open_dict restricted to one line
+    # -> (run counts, empty cell counts, important / half four / open three positions as line bitmasks)
+    # counts are kept sparse as (code, count) pairs
+    n = len(cells)
+    run_counts = [0] * N_CODES
+    empty_counts = [0] * N_CODES
+    important_pos, four_half_pos, three_both_pos = 0, 0, 0
+
+    i = 0
+    while i < n:
+        if cells[i] != color:
+            i += 1
+            continue
+        j = i
+        while j < n and cells[j] == color:
+            j += 1
+        if j - i >= 2:
+            prev_empty = i > 0 and cells[i-1] == EMPTY
+            next_empty = j < n and cells[j] == EMPTY
+            run_counts[pattern_code(j - i, KINDS[2 - prev_empty - next_empty])] += 1
+        i = j
+
+    for e in range(n):
+        if cells[e] != EMPTY:
+            continue
+        prev_end = e - 1
+        while prev_end >= 0 and cells[prev_end] == color:
+            prev_end -= 1
+        next_end = e + 1
+        while next_end < n and cells[next_end] == color:
+            next_end += 1
+        new_length = next_end - prev_end - 1
+        if new_length <= 1:
+            continue
+        prev_empty = prev_end >= 0 and cells[prev_end] == EMPTY
+        next_empty = next_end < n and cells[next_end] == EMPTY
+        code = pattern_code(new_length, KINDS[2 - prev_empty - next_empty])
+        empty_counts[code] += 1
+        if code in IMPORTANT_CODES:
+            important_pos |= 1 << e
+        if code == FOUR_HALF_CODE:
+            four_half_pos |= 1 << e
+        elif code == THREE_BOTH_CODE:
+            three_both_pos |= 1 << e
+    run_counts = tuple([(code, count) for code, count in enumerate(run_counts) if count])
+    empty_counts = tuple([(code, count) for code, count in enumerate(empty_counts) if count])
+    return (run_counts, empty_counts, important_pos, four_half_pos, three_both_pos)
+
+
+def decode_line(length: int, code: int) -> List[int]:
+    cells = []
+    for _ in range(length):
+        code, digit = divmod(code, 3)
+        cells.append(DIGIT_COLOR[digit])
+    return cells
+
+
+def build_line_table() -> List[List[Tuple]]:
+    # table[length][code] = (black stats, white stats) for every line content of every length up to WIDTH
+    interned: Dict[Tuple, Tuple] = dict()
+    table: List[List[Tuple]] = [[] for _ in range(WIDTH + 1)]
+    for length in range(2, WIDTH + 1):
+        entries = []
+        for code in range(3 ** length):
+            cells = decode_line(length, code)
+            stats = (scan_line(cells, BLACK), scan_line(cells, WHITE))
+            # identical entries share one object, which keeps the pickle small
+            entries.append(interned.setdefault(stats, stats))
+        table[length] = entries
+    return table
+
+
+def load_line_table(cache_dir: str=CACHE_DIR) -> List[List[Tuple]]:
+    cache_path = os.path.join(cache_dir, f"line_table_w{WIDTH}_l{WIN_LEN}_v{TABLE_VERSION}.pkl")
+    try:
+        with open(cache_path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    table = build_line_table()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(table, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # the table is still usable, it is just rebuilt by the next process
+        pass
+    return table
+
+
+LINE_TABLE: List[List[Tuple]] = load_line_table()
@@ -10,13 +10,25 @@ from mcts_config import MCTSConfig
 from game import GameAction, GameState, Game
 from mcts_node import MCTSNode
 
-from heuristic import Heuristic
+from heuristic import Heuristic, make_heuristic, config_fingerprint
+from eval_cache import EvalCache
+from eval_store import EvalStore
 from rollout import Rollout, get_next_state, get_terminal_value
+from transposition import TranspositionTable
+from bitboard import SYMMETRIES, pos_to_idx
+from symmetry import INVERSE_SYMMETRIES, symmetric_keys, child_symmetric_keys, stabilizer
+from search_stats import SearchStats
+from candidates import neighbourhood_masks, near_mask
+from move_prior import move_priors
 
 from typing import List, Optional, Dict, Tuple
 import random, math
 
 import time
+
+
+# MCTSConfig fields that do not change what a search returns
+_NON_SEARCH_FIELDS = {"heuristic_backend", "tree_backend", "eval_cache_size", "eval_store_path", "eval_store_max_step", "reuse_search_results", "clock_check_interval", "instrument", "pattern_cache_bytes"}
     
    
 class MCTS:
@@ -24,71 +36,391 @@ class MCTS:
         self.n_simulations = mcts_cfg.simu_count_per_search
         self.c_uct = mcts_cfg.c_uct
         
-        self.rollout = Rollout(
-            mcts_cfg.rollout_per_simu, mcts_cfg.rollout_depth,
-            Heuristic(mcts_cfg.rollout_heuristic_config),
-            mcts_cfg.rollout_important_pos_weight, mcts_cfg.rollout_other_pos_weight, mcts_cfg.rollout_use_heuristic_epsilon)
-        self.heuristic = Heuristic(mcts_cfg.heuristic_config)
+        self.eval_store = None
+        if mcts_cfg.eval_store_path is not None:
+            search_cfg = {k: v for k, v in vars(mcts_cfg).items() if k not in _NON_SEARCH_FIELDS}
+            self.eval_store = EvalStore(
+                mcts_cfg.eval_store_path,
+                [config_fingerprint(mcts_cfg.heuristic_config), config_fingerprint(mcts_cfg.rollout_heuristic_config)],
+                config_fingerprint(search_cfg))
+        self.reuse_search_results = mcts_cfg.reuse_search_results
+        
+        # shared by both heuristics and kept across searches
+        self.eval_cache = None
+        if mcts_cfg.eval_cache_size > 0:
+            self.eval_cache = EvalCache(mcts_cfg.eval_cache_size, self.eval_store, mcts_cfg.eval_store_max_step, mcts_cfg.use_symmetry)
+        if mcts_cfg.candidate_radius < 0:
+            raise ValueError("MCTS: candidate_radius must not be negative.")
+        self.candidate_radius = mcts_cfg.candidate_radius
+        self.neighbourhoods = neighbourhood_masks(self.candidate_radius) if self.candidate_radius > 0 else None
+        if mcts_cfg.rollout_backend == "python":
+            self.rollout = Rollout(
+                mcts_cfg.rollout_per_simu, mcts_cfg.rollout_depth,
+                make_heuristic(mcts_cfg.rollout_heuristic_config, mcts_cfg.heuristic_backend, self.eval_cache, mcts_cfg.pattern_cache_bytes),
+                mcts_cfg.rollout_important_pos_weight, mcts_cfg.rollout_other_pos_weight, mcts_cfg.rollout_use_heuristic_epsilon,
+                mcts_cfg.candidate_radius)
+        elif mcts_cfg.rollout_backend == "numpy":
+            # evaluates whole batches of boards, so it always uses the numpy heuristic
+            from batch_rollout import BatchRollout
+            self.rollout = BatchRollout(
+                mcts_cfg.rollout_per_simu, mcts_cfg.rollout_depth,
+                make_heuristic(mcts_cfg.rollout_heuristic_config, "numpy", self.eval_cache),
+                mcts_cfg.rollout_important_pos_weight, mcts_cfg.rollout_other_pos_weight, mcts_cfg.rollout_use_heuristic_epsilon,
+                mcts_cfg.candidate_radius)
+        else:
+            raise ValueError(f"unknown rollout backend: {mcts_cfg.rollout_backend}")
+        self.heuristic = make_heuristic(mcts_cfg.heuristic_config, mcts_cfg.heuristic_backend, self.eval_cache, mcts_cfg.pattern_cache_bytes)
         
         self.rollout_weight = mcts_cfg.rollout_weight
         self.heuristic_weight = mcts_cfg.heuristic_weight
         self.use_break_early = mcts_cfg.use_break_early
+        if mcts_cfg.clock_check_interval <= 0:
+            raise ValueError("MCTS: clock_check_interval must be positive.")
+        self.clock_check_interval = mcts_cfg.clock_check_interval
+        # search passes its SearchStats to simulation / array_simulation to time the phases; off they get None and read no clock
+        self.instrument = mcts_cfg.instrument
+        
+        # root of the previous search, see find_root
+        self.reuse_tree = mcts_cfg.reuse_tree
+        self.reuse_tree_depth = mcts_cfg.reuse_tree_depth
+        self._root: Optional[MCTSNode] = None
+        self.reused_visit_count = 0
+        self.last_visit_counts: Dict[GameAction, int] = dict()
+        self.last_stats = SearchStats()
+        
+        # symmetric nodes (symmetry.py), object backend only; the root found by find_root is then the
+        # root_symmetry-th image of the searched state
+        self.use_symmetry = mcts_cfg.use_symmetry and mcts_cfg.tree_backend == "object"
+        self.root_symmetry = 0
+        
+        # owned by this search only, kept across moves together with the tree
+        self.transposition_table = None
+        if mcts_cfg.transposition_table_size > 0 and mcts_cfg.tree_backend == "object":
+            self.transposition_table = TranspositionTable(mcts_cfg.transposition_table_size)
         
+        if mcts_cfg.tree_backend not in ["object", "array"]:
+            raise ValueError(f"unknown tree backend: {mcts_cfg.tree_backend}")
         
-    def search(self, root_state: GameState):
-        start = time.time()
-        root_node = MCTSNode(root_state)
-        if root_node.is_terminal():
-            return None, dict()
+        # progressive widening and the PUCT prior, object backend only (see MCTSNode.set_priors)
+        if mcts_cfg.widening_c < 0 or mcts_cfg.prior_weight < 0:
+            raise ValueError("MCTS: widening_c and prior_weight must not be negative.")
+        if not 0 < mcts_cfg.widening_alpha <= 1:
+            raise ValueError("MCTS: widening_alpha must be in (0, 1].")
+        if mcts_cfg.tree_backend != "object" and (mcts_cfg.widening_c > 0 or mcts_cfg.prior_weight > 0):
+            raise ValueError("MCTS: widening_c and prior_weight need the object tree backend.")
+        self.widening = (mcts_cfg.widening_c, mcts_cfg.widening_alpha) if mcts_cfg.widening_c > 0 else None
+        self.prior_weight = mcts_cfg.prior_weight
+        self.prior_important_weight = mcts_cfg.prior_important_weight
+        self.use_priors = self.widening is not None or self.prior_weight > 0
+        self.tree_backend = mcts_cfg.tree_backend
+        # see array_tree.ArrayTree, a tree without transpositions
+        self.array_tree = None
         
-        for i in range(self.n_simulations):
-            break_early = self.simulation(root_node)
+        
+    def find_root(self, root_state: GameState) -> MCTSNode:
+        # the subtree of root_state when it lies at most reuse_tree_depth plies below the previous root
+        root_node = None
+        self.root_symmetry = 0
+        sym_keys = symmetric_keys(root_state.black, root_state.white, root_state.next_player) if self.use_symmetry else None
+        if not self.reuse_tree:
+            if self.transposition_table is not None:
+                self.transposition_table.clear()
+        elif self.transposition_table is not None:
+            if self.use_symmetry:
+                found = self.transposition_table.get_symmetric(sym_keys, root_state.black, root_state.white)
+                if found is not None:
+                    root_node, self.root_symmetry = found
+            else:
+                root_node = self.transposition_table.get(root_state.key, root_state.black, root_state.white)
+        if root_node is None and self.reuse_tree and self._root is not None:
+            root_node = self._root.find_descendant(root_state, self.reuse_tree_depth)
+        if root_node is None:
+            root_node = self.new_node(root_state, sym_keys)
+        self._root = root_node if self.reuse_tree else None
+        return root_node
+    
+    
+    def new_node(self, state: GameState, sym_keys: Optional[Tuple[int, ...]]=None, near: Optional[int]=None) -> MCTSNode:
+        if self.neighbourhoods is not None and near is None:
+            near = near_mask(state.black | state.white, self.candidate_radius)
+        if self.use_symmetry:
+            if sym_keys is None:
+                sym_keys = symmetric_keys(state.black, state.white, state.next_player)
+            node = MCTSNode(state, sym_keys, stabilizer(sym_keys, state.black, state.white), near, self.widening)
+        else:
+            node = MCTSNode(state, near=near, widening=self.widening)
+        if self.transposition_table is not None:
+            self.transposition_table.put(node)
+        return node
+    
+    
+    def child_node(self, node: MCTSNode, action: GameAction) -> MCTSNode:
+        # the node of another move order when the position transposes, otherwise a new one
+        # with symmetries the node may hold an image of the child, whose own children are then in that image
+        sym_keys = None
+        if self.use_symmetry:
+            if self.transposition_table is not None:
+                child, sym_keys = self.transposition_table.get_symmetric_child(node, action)
+                if child is not None:
+                    return child
+            else:
+                sym_keys = child_symmetric_keys(node.sym_keys, node.state.next_player, action.idx)
+        elif self.transposition_table is not None:
+            child = self.transposition_table.get_child(node.state, action)
+            if child is not None:
+                return child
+        near = node.near | self.neighbourhoods[action.idx] if self.neighbourhoods is not None else None
+        return self.new_node(get_next_state(node.state, action), sym_keys, near)
+    
+    
+    def expand(self, node: MCTSNode) -> MCTSNode:
+        # priors are computed on the first expansion, most nodes are never expanded
+        if self.use_priors and node.priors is None:
+            _, important_pos_list = self.heuristic.estimate_value(node.state)
+            important_mask = 0
+            for x, y in important_pos_list:
+                important_mask |= 1 << pos_to_idx(x, y)
+            node.set_priors(move_priors(node.state, node.move_mask, important_mask, self.prior_important_weight))
+        action = node.select_legal_unexpanded_action()
+        return node.expand(action, self.child_node(node, action))
+    
+    
+    def find_array_root(self, root_state: GameState) -> None:
+        # find_root for the array backend, the reused subtree is copied into a fresh tree
+        from array_tree import ArrayTree
+        node = None
+        if self.reuse_tree and self.array_tree is not None:
+            node = self.array_tree.find_descendant(root_state, self.reuse_tree_depth)
+        if node is None:
+            self.array_tree = ArrayTree(root_state, candidate_radius=self.candidate_radius)
+        elif node != self.array_tree.root:
+            self.array_tree = self.array_tree.subtree(node)
+        
+        
+    def search(self, root_state: GameState, time_budget_ms: Optional[float]=None, max_simulations: Optional[int]=None) -> Tuple[Optional[GameAction], Dict[GameAction, float], SearchStats]:
+        # with time_budget_ms or max_simulations the search is anytime: it stops at the deadline, after max_simulations
+        # or as soon as the second most visited root child can no longer catch up with the first
+        if self.eval_store is not None:
+            # bulk read of the stored evals, so no simulation waits on sqlite
+            self.eval_store.load()
+        start = time.perf_counter()
+        counters = self.counters()
+        stats = SearchStats()
+        self.last_visit_counts = dict()
+        if root_state.done:
+            stats.stop_reason = "done"
+            return None, dict(), self.finish_stats(stats, start, counters)
+        root_node = None
+        if self.tree_backend == "array":
+            self.find_array_root(root_state)
+            root_visit_count = self.array_tree.root_visit_count()
+        else:
+            root_node = self.find_root(root_state)
+            root_visit_count = root_node.visit_count
+        
+        if self.eval_store is not None and self.reuse_search_results:
+            visits = self.eval_store.get_search(root_state.key)
+            # an empty distribution is treated as a miss
+            if visits:
+                visit_rate_dict = {GameAction.ALL_ACTIONS[idx]: visit_rate for idx, visit_rate in visits}
+                stats.stop_reason = "stored"
+                return max(visit_rate_dict, key=visit_rate_dict.get), visit_rate_dict, self.finish_stats(stats, start, counters)
+        
+        anytime = time_budget_ms is not None or max_simulations is not None
+        if max_simulations is not None:
+            budget = max_simulations
+        else:
+            budget = self.n_simulations if time_budget_ms is None else math.inf
+        deadline = start + time_budget_ms / 1000 if time_budget_ms is not None else math.inf
+        
+        self.reused_visit_count = root_visit_count
+        stats.reused_visits = root_visit_count
+        stats.instrumented = self.instrument
+        # only instrumented searches time their phases
+        timed_stats = stats if self.instrument else None
+        n_visits = root_visit_count
+        while n_visits < budget:
+            if self.tree_backend == "array":
+                break_early = self.array_simulation(timed_stats)
+            else:
+                break_early = self.simulation(root_node, timed_stats)
+            n_visits += 1
             if self.use_break_early and break_early:
+                stats.stop_reason = "break_early"
                 break
+            if anytime and (n_visits - root_visit_count) % self.clock_check_interval == 0:
+                now = time.perf_counter()
+                if now >= deadline:
+                    stats.stop_reason = "deadline"
+                    break
+                remaining = budget - n_visits
+                # no rate yet while the clock has not moved since start
+                if time_budget_ms is not None and now > start:
+                    # simulations that still fit before the deadline at the rate of this search
+                    remaining = min(remaining, int((deadline - now) * (n_visits - root_visit_count) / (now - start)))
+                if self.is_decided(root_node, remaining):
+                    stats.stop_reason = "decided"
+                    stats.saved_simulations = remaining
+                    break
+        stats.n_simulations = n_visits - root_visit_count
         
-        max_visit_rate = -math.inf
+        max_visit_count = -math.inf
         max_visit_action = None
-        visit_rate_dict = root_node.get_visit_distribution()
-        for action ,visit_rate in visit_rate_dict.items():
-            if max_visit_rate < visit_rate:
-                max_visit_rate   = visit_rate
+        visit_count_dict = self.root_visit_counts(root_node)
+        for action, n in visit_count_dict.items():
+            if max_visit_count < n:
+                max_visit_count  = n
                 max_visit_action = action
-                
-        GameState.NEXT_STATE_MAP.clear()
-        end = time.time()
-        print(f"搜索时间: {end-start:.4f}s")
-        return max_visit_action, visit_rate_dict
+        if self.use_symmetry:
+            # the most visited merged action decides the move, in the distribution its visits are shared by its orbit
+            visit_count_dict = {self.real_action(action): n for action, n in root_node.get_spread_visit_counts().items()}
+            if max_visit_action is not None:
+                max_visit_action = self.real_action(max_visit_action)
+        # raw counts of the last search, parallel_mcts merges them across workers
+        self.last_visit_counts = visit_count_dict
+        child_visit_count = sum(visit_count_dict.values())
+        visit_rate_dict = {action: n / child_visit_count for action, n in visit_count_dict.items()} if child_visit_count else {}
+        
+        if self.eval_store is not None:
+            # written once per search, not per simulation; a stopped anytime search is not a full result
+            if not anytime and visit_rate_dict:
+                self.eval_store.add_search(root_state.key, [(action.idx, visit_rate) for action, visit_rate in visit_rate_dict.items()])
+            self.eval_store.flush()
+        return max_visit_action, visit_rate_dict, self.finish_stats(stats, start, counters)
+    
+    
+    def counters(self) -> Tuple[int, ...]:
+        # cumulative counters of the cache, the transposition table and the rollout, differenced per search
+        cache, table = self.eval_cache, self.transposition_table
+        return (
+            cache.hits if cache is not None else 0, cache.misses if cache is not None else 0,
+            table.hits if table is not None else 0, table.misses if table is not None else 0,
+            self.rollout.n_played, self.rollout.n_plies,
+        )
+    
+    
+    def finish_stats(self, stats: SearchStats, start: float, counters: Tuple[int, ...]) -> SearchStats:
+        stats.elapsed = time.perf_counter() - start
+        (stats.eval_cache_hits, stats.eval_cache_misses, stats.transposition_hits, stats.transposition_misses,
+         stats.n_rollouts, stats.rollout_plies) = [end - begin for end, begin in zip(self.counters(), counters)]
+        self.last_stats = stats
+        return stats
+    
+    
+    def real_action(self, action: GameAction) -> GameAction:
+        # action of the root node's state -> the same action on the searched state
+        return GameAction.ALL_ACTIONS[SYMMETRIES[INVERSE_SYMMETRIES[self.root_symmetry]][action.idx]]
+    
+    
+    def root_visit_counts(self, root_node: Optional[MCTSNode]) -> Dict[GameAction, int]:
+        # root_node is not used by the array backend
+        if self.tree_backend == "array":
+            return self.array_tree.get_visit_counts()
+        return root_node.get_visit_counts()
+    
+    
+    def is_decided(self, root_node: Optional[MCTSNode], remaining: int) -> bool:
+        # the most visited root child stays first even if every remaining simulation goes to the second one
+        first, second = 0, 0
+        for n in self.root_visit_counts(root_node).values():
+            if n > first:
+                first, second = n, first
+            elif n > second:
+                second = n
+        return second + remaining < first
         
         
-    def simulation(self, root_node: MCTSNode) -> bool:
+    def simulation(self, root_node: MCTSNode, stats: Optional[SearchStats]=None) -> bool:
+        # stats: the phases of an instrumented search are timed into it, None skips every clock call
+        t = time.perf_counter() if stats is not None else 0.0
         cur_node = root_node
-        root_child = None
+        path = [root_node]
         # selection
         while not cur_node.is_terminal() and cur_node.is_fully_expanded():
-            _, cur_node = cur_node.select_child(self.c_uct)
-            if root_child is None:
-                root_child = cur_node
+            _, cur_node = cur_node.select_child(self.c_uct, self.prior_weight)
+            path.append(cur_node)
+        if stats is not None:
+            t = self.end_phase(stats, "selection", t)
         
         if not cur_node.is_terminal():
             # expansion
-            action = cur_node.select_legal_unexpanded_action()
-            next_state = get_next_state(cur_node.state, action)
-            cur_node = cur_node.expand(action, next_state)
-            if root_child is None:
-                root_child = cur_node
+            cur_node = self.expand(cur_node)
+            path.append(cur_node)
+            if stats is not None:
+                t = self.end_phase(stats, "expansion", t)
+        root_child = path[1] if len(path) > 1 else None
+        # a transposition may lead to a node that already has visits
+        is_new = stats is not None and cur_node.visit_count == 0
             
-        if cur_node.is_terminal():
-            value = get_terminal_value(cur_node.state)
-        else:
-            value_rollout = self.rollout.estimate_value(cur_node.state)
-            value_heuristic, _ = self.heuristic.estimate_value(cur_node.state)
-            value = self.rollout_weight * value_rollout + self.heuristic_weight * value_heuristic
+        value = self.evaluate_leaf(cur_node.state, stats)
                 
-        cur_node.backup(value)
+        if stats is not None:
+            t = time.perf_counter()
+        # backup along the path, the value flips sides at every ply
+        for node in reversed(path):
+            node.update(value)
+            value = -value
+        if stats is not None:
+            self.end_phase(stats, "backup", t)
+            self.record_leaf(stats, len(path) - 1, is_new)
         
         if root_child is not None and root_child.is_dominate(self.n_simulations):
             return True
         return False
+    
+    
+    def array_simulation(self, stats: Optional[SearchStats]=None) -> bool:
+        # simulation on self.array_tree, same steps as simulation; selection and expansion are one call, timed as selection
+        t = time.perf_counter() if stats is not None else 0.0
+        tree = self.array_tree
+        leaf = tree.select_and_expand(self.c_uct)
+        if stats is not None:
+            t = self.end_phase(stats, "selection", t)
+        is_new = stats is not None and tree.visit[leaf] == 0
+        
+        value = self.evaluate_leaf(tree.states[leaf], stats)
+        
+        if stats is not None:
+            t = time.perf_counter()
+        tree.backup(leaf, value)
+        if stats is not None:
+            self.end_phase(stats, "backup", t)
+            self.record_leaf(stats, tree.depth(leaf), is_new)
+        
+        root_child = tree.root_child(leaf)
+        if root_child is not None and tree.visit[root_child] >= self.n_simulations / 2:
+            return True
+        return False
+    
+    
+    def evaluate_leaf(self, state: GameState, stats: Optional[SearchStats]=None) -> float:
+        if state.done:
+            return get_terminal_value(state)
+        t = time.perf_counter() if stats is not None else 0.0
+        # heuristic first: it is the lookup that may be answered by the store, the rollout then finds the leaf in the cache
+        value_heuristic, _ = self.heuristic.estimate_value(state)
+        if stats is not None:
+            t = self.end_phase(stats, "heuristic", t)
+        value_rollout = self.rollout.estimate_value(state)
+        if stats is not None:
+            self.end_phase(stats, "rollout", t)
+        return self.rollout_weight * value_rollout + self.heuristic_weight * value_heuristic
+    
+    
+    @staticmethod
+    def end_phase(stats: SearchStats, phase: str, since: float) -> float:
+        # adds the time since since to phase and returns the clock, the start of the next phase
+        now = time.perf_counter()
+        stats.phase_time[phase] += now - since
+        stats.phase_calls[phase] += 1
+        return now
+    
+    
+    @staticmethod
+    def record_leaf(stats: SearchStats, depth: int, is_new: bool) -> None:
+        stats.max_depth = max(stats.max_depth, depth)
+        stats.total_depth += depth
+        stats.n_expansions += int(is_new)
 
 
     
@@ -122,7 +454,8 @@ if __name__ == "__main__":
         if cur_state.done:
             print(f"finish")
             break
-        action, visit_rate_dict = agent.search(cur_state)
+        action, visit_rate_dict, stats = agent.search(cur_state)
+        print(stats)
         print_visit_rate(visit_rate_dict)
         if action is not None:
             print(f"choose action ({action.x}, {action.y})")
@@ -133,4 +466,10 @@ if __name__ == "__main__":
             else:
                 game.check(action)
     cur_state = game.get_state()
-    print(cur_state)
\ No newline at end of file
+    print(cur_state)
+    if agent.eval_cache is not None:
+        print(f"估值缓存: {agent.eval_cache.stats()}")
+    if agent.eval_store is not None:
+        print(f"估值存储: {agent.eval_store.stats()}")
+    if agent.transposition_table is not None:
+        print(f"置换表: {agent.transposition_table.stats()}")
\ No newline at end of file
@@ -1,10 +1,32 @@
+from constant import MCTS_WIDENING_C, MCTS_WIDENING_ALPHA, MCTS_PRIOR_WEIGHT, MCTS_PRIOR_IMPORTANT_WEIGHT
+from constant import MCTS_CANDIDATE_RADIUS, MCTS_CLOCK_CHECK_INTERVAL, MCTS_INSTRUMENT, MCTS_USE_SYMMETRY, MCTS_REUSE_TREE, MCTS_REUSE_TREE_DEPTH, MCTS_TRANSPOSITION_TABLE_SIZE, MCTS_TREE_BACKEND
+from constant import ROLLOUT_BACKEND, HEURISTIC_BACKEND, HEURISTIC_PATTERN_CACHE_BYTES, HEURISTIC_EVAL_CACHE_SIZE, EVAL_STORE_MAX_STEP
+
+from typing import Optional
+
+
 class MCTSConfig:
     def __init__(self, simu_count_per_search: int, c_uct: float, 
                  rollout_per_simu: int, rollout_depth: int, rollout_heuristic_config,
                  rollout_important_pos_weight: int, rollout_other_pos_weight: int, rollout_use_heuristic_epsilon: float, 
                  heuristic_config,
                  rollout_weight: float, heuristic_weight: float,
-                 use_break_early: bool=False):
+                 use_break_early: bool=False,
+                 heuristic_backend: str=HEURISTIC_BACKEND,
+                 eval_cache_size: int=HEURISTIC_EVAL_CACHE_SIZE,
+                 eval_store_path: Optional[str]=None, eval_store_max_step: int=EVAL_STORE_MAX_STEP,
+                 reuse_search_results: bool=False,
+                 reuse_tree: bool=MCTS_REUSE_TREE, reuse_tree_depth: int=MCTS_REUSE_TREE_DEPTH,
+                 transposition_table_size: int=MCTS_TRANSPOSITION_TABLE_SIZE,
+                 tree_backend: str=MCTS_TREE_BACKEND,
+                 rollout_backend: str=ROLLOUT_BACKEND,
+                 clock_check_interval: int=MCTS_CLOCK_CHECK_INTERVAL,
+                 use_symmetry: bool=MCTS_USE_SYMMETRY,
+                 instrument: bool=MCTS_INSTRUMENT,
+                 candidate_radius: int=MCTS_CANDIDATE_RADIUS,
+                 widening_c: float=MCTS_WIDENING_C, widening_alpha: float=MCTS_WIDENING_ALPHA,
+                 prior_weight: float=MCTS_PRIOR_WEIGHT, prior_important_weight: float=MCTS_PRIOR_IMPORTANT_WEIGHT,
+                 pattern_cache_bytes: int=HEURISTIC_PATTERN_CACHE_BYTES):
         self.simu_count_per_search = simu_count_per_search
         self.c_uct = c_uct
         
@@ -15,10 +37,37 @@ class MCTSConfig:
         self.rollout_important_pos_weight = rollout_important_pos_weight
         self.rollout_other_pos_weight = rollout_other_pos_weight
         self.rollout_use_heuristic_epsilon = rollout_use_heuristic_epsilon
+        self.rollout_backend = rollout_backend
         
         self.heuristic_config = heuristic_config
         
         self.rollout_weight= rollout_weight
         self.heuristic_weight = heuristic_weight
         
-        self.use_break_early = use_break_early
\ No newline at end of file
+        self.use_break_early = use_break_early
+        self.clock_check_interval = clock_check_interval
+        self.instrument = instrument
+        # visits already in a reused subtree count toward simu_count_per_search
+        self.reuse_tree = reuse_tree
+        self.reuse_tree_depth = reuse_tree_depth
+        self.transposition_table_size = transposition_table_size
+        self.use_symmetry = use_symmetry
+        self.candidate_radius = candidate_radius
+        # progressive widening and the PUCT move prior, off at 0; only the object tree backend supports them,
+        # MCTS and TreeParallelMCTS raise ValueError for other trees
+        self.widening_c = widening_c
+        self.widening_alpha = widening_alpha
+        self.prior_weight = prior_weight
+        self.prior_important_weight = prior_important_weight
+        self.tree_backend = tree_backend
+        
+        self.heuristic_backend = heuristic_backend
+        self.eval_cache_size = eval_cache_size
+        # per incremental heuristic, see heuristic_incremental.IncrementalHeuristic
+        self.pattern_cache_bytes = pattern_cache_bytes
+        
+        # see eval_store.EvalStore, None disables it
+        self.eval_store_path = eval_store_path
+        self.eval_store_max_step = eval_store_max_step
+        # answer a search from the store when the same position was searched with the same config before
+        self.reuse_search_results = reuse_search_results
\ No newline at end of file
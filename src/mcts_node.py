@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 from game import GameAction, GameState
+from bitboard import iter_bits
+from symmetry import orbit, orbit_representatives
+from candidates import candidate_mask
 
 from typing import Tuple, Optional, Dict, List
 
@@ -9,43 +12,79 @@ import random
 
 
 class MCTSNode:
-    def __init__(self, state: GameState, parent: Optional[MCTSNode]=None):
+    # a node can be the child of several parents when positions transpose (see transposition.py),
+    # so there is no parent link and MCTS backs values up along the selected path
+    def __init__(self, state: GameState, sym_keys: Optional[Tuple[int, ...]]=None, symmetries: Optional[List[int]]=None, near: Optional[int]=None,
+                 widening: Optional[Tuple[float, float]]=None):
         self.state: GameState = state
+        # see symmetry.symmetric_keys, only set when MCTS uses symmetries
+        self.sym_keys = sym_keys
+        # symmetries that leave the position unchanged: only one action per orbit is expanded and
+        # its visits are spread over the orbit by get_visit_distribution
+        self.symmetries = symmetries if symmetries is not None and len(symmetries) > 1 else None
+        # cells near a stone (see candidates.py), None when every legal move is a candidate
+        self.near = near
+        move_mask = state.legal_mask if near is None else candidate_mask(state.legal_mask, near)
+        self._move_mask: int = move_mask if self.symmetries is None else orbit_representatives(move_mask, self.symmetries)
+        # (c, alpha) of progressive widening: at most max(1, c * N ** alpha) children, see set_priors
+        self.widening = widening
+        # prior probability by bit index of every move of the move mask, None until set_priors
+        self.priors: Optional[Dict[int, float]] = None
         
-        self._parent: Optional[MCTSNode] = parent
         self._children: Dict[GameAction, MCTSNode] = dict()
         
         self._visit_count: int = 0      # N
         self._total_value: float = 0.0  # W
         
+        # bits of the expanded actions, and the unexpanded ones as bit indices in random order
+        self._expanded_mask: int = 0
+        self._unexpanded: Optional[List[int]] = None
         
-    def is_leaf(self) -> bool:
-        return len(self._children) == 0
+        
+    @property
+    def visit_count(self) -> int:
+        return self._visit_count
     
     
-    def is_root(self) -> bool:
-        return self._parent is None
+    def is_leaf(self) -> bool:
+        return len(self._children) == 0
     
     
     def is_terminal(self) -> bool:
         return self.state.done
     
     
+    @property
+    def move_mask(self) -> int:
+        return self._move_mask
+    
+    
     def is_fully_expanded(self) -> bool:
-        return len(self._children) == len(self.state.legal_actions)
+        # with widening: no further child is admitted at the current visit count
+        if self._expanded_mask == self._move_mask:
+            return True
+        if self.widening is None:
+            return False
+        c, alpha = self.widening
+        return len(self._children) >= max(1.0, c * self._visit_count ** alpha)
     
         
-    def select_child(self, scalar: float) -> Tuple[GameAction, MCTSNode]:
+    def select_child(self, scalar: float, prior_weight: float=0.0) -> Tuple[GameAction, MCTSNode]:
+        # with priors, the PUCT term prior_weight * P(a) * sqrt(N) / (1 + n(a)) is added to the UCT score
         if self.is_leaf():
             raise ValueError("select_child cannot called by leaf node.")
         best_score = -math.inf
         best_action_list = []
+        priors = self.priors if prior_weight > 0 else None
+        prior_scale = prior_weight * math.sqrt(self._visit_count)
         for a, c in self._children.items():
             if c._visit_count != 0:
                 exploit = c._total_value / c._visit_count
                 explore = math.sqrt(2.0 * math.log(self._visit_count) / float(c._visit_count))
                 # print(f"{exploit:.4f}, {scalar*explore:.4f}")
                 score = -exploit + scalar * explore
+                if priors is not None:
+                    score += prior_scale * priors[a.idx] / (1 + c._visit_count)
             else:
                 score = math.inf
             
@@ -63,17 +102,35 @@ class MCTSNode:
         return list(self._children.keys())
     
 
+    def set_priors(self, priors: Dict[int, float]) -> None:
+        # before the first expansion; the unexpanded actions are then taken highest prior first
+        if self._unexpanded is not None:
+            raise ValueError("set_priors after the first expansion.")
+        self.priors = priors
+    
+
     def select_legal_unexpanded_action(self) -> GameAction:
-        legal_unexpanded_candidates = [action for action in self.state.legal_actions if action not in self._children]
-        return random.choice(legal_unexpanded_candidates)
+        if self._unexpanded is None:
+            self._unexpanded = list(iter_bits(self._move_mask & ~self._expanded_mask))
+            random.shuffle(self._unexpanded)
+            if self.priors is not None:
+                # stable, so equal priors stay in random order
+                self._unexpanded.sort(key=self.priors.__getitem__)
+        return GameAction.ALL_ACTIONS[self._unexpanded[-1]]
     
 
-    def expand(self, action: GameAction, next_state: GameState) -> MCTSNode:
+    def expand(self, action: GameAction, child: MCTSNode) -> MCTSNode:
+        # child is a new node, or the shared node of a transposed position
         if action in self._children:
             raise ValueError("Action already exists in child node list.")
-        new_node = MCTSNode(next_state, self)
-        self._children[action] = new_node
-        return new_node
+        self._children[action] = child
+        self._expanded_mask |= 1 << action.idx
+        if self._unexpanded is not None:
+            if self._unexpanded[-1] == action.idx:
+                self._unexpanded.pop()
+            else:
+                self._unexpanded.remove(action.idx)
+        return child
     
     
     def update(self, value: float) -> None:
@@ -81,21 +138,48 @@ class MCTSNode:
         self._total_value += value
         
         
-    def backup(self, value: float) -> None:
-        self.update(value)
-        if self._parent is not None:
-            self._parent.backup(-value)
-            
+    def find_descendant(self, state: GameState, max_depth: int) -> Optional[MCTSNode]:
+        # breadth first down to max_depth plies, matched by zobrist key first
+        level = [self]
+        for depth in range(max_depth + 1):
+            next_level = []
+            for node in level:
+                if node.state.key == state.key and node.state == state:
+                    return node
+                if depth < max_depth:
+                    next_level.extend(node._children.values())
+            level = next_level
+        return None
+    
+    
+    def get_visit_counts(self) -> Dict[GameAction, int]:
+        return {a: c._visit_count for a, c in self._children.items()}
+    
     
     def get_visit_distribution(self) -> Dict[GameAction, float]:
-        if self._visit_count == 0:
+        # shared children may also be visited through other parents, so normalise by their own total
+        visit_counts = self.get_spread_visit_counts()
+        child_visit_count = sum(visit_counts.values())
+        if child_visit_count == 0:
             return {}
         visit_distribution = {}
-        for a, c in self._children.items():
-            visit_distribution[a] = c._visit_count / self._visit_count
+        for a, n in visit_counts.items():
+            visit_distribution[a] = n / child_visit_count
         return visit_distribution
     
     
+    def get_spread_visit_counts(self) -> Dict[GameAction, float]:
+        # get_visit_counts over all legal actions: the visits of a merged action are shared equally by its orbit
+        if self.symmetries is None:
+            return self.get_visit_counts()
+        visit_counts = {}
+        for a, c in self._children.items():
+            cells = orbit(a.idx, self.symmetries)
+            for idx in cells:
+                visit_counts[GameAction.ALL_ACTIONS[idx]] = c._visit_count / len(cells)
+        return visit_counts
+    
+    
     def is_dominate(self, total_visit_count) -> bool:
         return self._visit_count >= total_visit_count / 2
     
\ No newline at end of file
@@ -0,0 +1,56 @@
+from constant import WIN_LEN
+from game import GameState
+from bitboard import FIVE_MASKS, iter_bits
+
+from typing import Dict, List
+
+
+def _window_scores(defence: bool) -> List[float]:
+    # 8 times more per stone, and a window one stone short of WIN_LEN far above the rest;
+    # blocking scores 3/4 of extending, and half of it for the window one stone short. [0, 1, 8, 64, 4096] and [0, 1, 6, 48, 2048] for WIN_LEN 5
+    scores = []
+    for n_stones in range(WIN_LEN):
+        if n_stones == 0:
+            scores.append(0.0)
+        elif n_stones == WIN_LEN - 1:
+            scores.append(8.0 ** n_stones * (0.5 if defence else 1.0))
+        elif n_stones == 1:
+            scores.append(1.0)
+        else:
+            scores.append(8.0 ** (n_stones - 1) * (0.75 if defence else 1.0))
+    return scores
+
+
+# score of an empty cell per WIN_LEN window through it, by the number of stones in the window when the other side has none:
+# extending own lines first, blocking the opponent's slightly less
+ATTACK_SCORES: List[float] = _window_scores(defence=False)
+DEFENCE_SCORES: List[float] = _window_scores(defence=True)
+# every candidate keeps a small share, so widening reaches it eventually
+BASE_SCORE: float = 1.0
+
+
+def pattern_scores(state: GameState, move_mask: int) -> Dict[int, float]:
+    # line pattern score of every cell of move_mask for state.next_player, from the windows through the cell
+    mine = state.get_stones(state.next_player)
+    theirs = state.get_stones(-state.next_player)
+    scores = {}
+    for idx in iter_bits(move_mask):
+        score = BASE_SCORE
+        for window in FIVE_MASKS[idx]:
+            own = (window & mine).bit_count()
+            opp = (window & theirs).bit_count()
+            if opp == 0:
+                score += ATTACK_SCORES[own]
+            elif own == 0:
+                score += DEFENCE_SCORES[opp]
+        scores[idx] = score
+    return scores
+
+
+def move_priors(state: GameState, move_mask: int, important_mask: int, important_weight: float) -> Dict[int, float]:
+    # prior probability of every move of move_mask: pattern score, times important_weight for the important positions of Heuristic
+    scores = pattern_scores(state, move_mask)
+    for idx in iter_bits(important_mask & move_mask):
+        scores[idx] *= important_weight
+    total = sum(scores.values())
+    return {idx: score / total for idx, score in scores.items()}
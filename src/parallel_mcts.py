@@ -0,0 +1,134 @@
+from game import GameAction, GameState
+from mcts_config import MCTSConfig
+from mcts import MCTS
+from search_stats import SearchStats
+
+from typing import Dict, Optional, Tuple
+
+import copy
+import math
+import multiprocessing
+import random
+import time
+
+
+def _worker_main(conn, mcts_cfg: MCTSConfig, seed: int) -> None:
+    # one MCTS per process, built once and kept for every search of the pool
+    random.seed(seed)
+    agent = MCTS(mcts_cfg)
+    while True:
+        state = conn.recv()
+        if state is None:
+            break
+        _, _, stats = agent.search(state)
+        conn.send(({action.idx: n for action, n in agent.last_visit_counts.items()}, stats))
+    conn.close()
+
+
+class ParallelMCTS:
+    # root parallelism: every worker searches the same root with its own tree and random stream,
+    # for a share of simu_count_per_search, and the root visit counts are summed
+    def __init__(self, mcts_cfg: MCTSConfig, n_workers: int, seed: Optional[int]=None):
+        if n_workers <= 0:
+            raise ValueError("ParallelMCTS: n_workers must be positive.")
+        self.n_workers = n_workers
+        self.n_simulations = mcts_cfg.simu_count_per_search
+        if seed is None:
+            seed = random.randrange(1 << 31)
+
+        self._conns = []
+        self._processes = []
+        for i in range(n_workers):
+            worker_cfg = copy.copy(mcts_cfg)
+            # budget split as evenly as possible
+            worker_cfg.simu_count_per_search = self.n_simulations // n_workers + (1 if i < self.n_simulations % n_workers else 0)
+            # a stored search result is the answer of a whole search, not of a share
+            worker_cfg.reuse_search_results = False
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker_main, args=(child_conn, worker_cfg, seed + i), daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+
+    def search(self, root_state: GameState) -> Tuple[Optional[GameAction], Dict[GameAction, float], SearchStats]:
+        start = time.perf_counter()
+        stats = SearchStats()
+        stats.n_workers = self.n_workers
+        if root_state.done:
+            stats.stop_reason = "done"
+            return None, dict(), stats
+        for conn in self._conns:
+            conn.send(root_state)
+        visit_counts: Dict[int, int] = dict()
+        for conn in self._conns:
+            worker_counts, worker_stats = conn.recv()
+            for idx, n in worker_counts.items():
+                visit_counts[idx] = visit_counts.get(idx, 0) + n
+            stats.add(worker_stats)
+
+        total = sum(visit_counts.values())
+        max_visit_rate = -math.inf
+        max_visit_action = None
+        visit_rate_dict = dict()
+        for idx, n in visit_counts.items():
+            action = GameAction.ALL_ACTIONS[idx]
+            visit_rate_dict[action] = n / total
+            if max_visit_rate < visit_rate_dict[action]:
+                max_visit_rate = visit_rate_dict[action]
+                max_visit_action = action
+        stats.elapsed = time.perf_counter() - start
+        return max_visit_action, visit_rate_dict, stats
+
+
+    def close(self) -> None:
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._conns = []
+        self._processes = []
+
+
+    def __enter__(self) -> "ParallelMCTS":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH
+    from constant import ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
+    from constant import HEURISTIC_CFG
+    from game import Game
+    from mcts import print_visit_rate
+
+    mcts_cfg = MCTSConfig(
+        MCTS_SIMU_COUNT_PER_SEARCH, MCTS_SELECT_UCT,
+        ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG,
+        ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON,
+        HEURISTIC_CFG,
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+    )
+    game = Game()
+    with ParallelMCTS(mcts_cfg, max(1, multiprocessing.cpu_count()), seed=0) as agent:
+        for i in range(6):
+            cur_state = game.get_state()
+            if cur_state.done:
+                break
+            action, visit_rate_dict, stats = agent.search(cur_state)
+            print(stats)
+            print_visit_rate(visit_rate_dict)
+            print(f"choose action ({action.x}, {action.y})")
+            game.execute_action(action)
+            game.check(action)
+    print(game.get_state())
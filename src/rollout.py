@@ -1,26 +1,23 @@
+from constant import BLACK, WHITE, EMPTY
 from game import GameAction, GameState, Game
+from bitboard import FULL_MASK, ZOBRIST_KEYS, ZOBRIST_SIDE, idx_to_pos, has_five_at, nth_bit
 
-from typing import Tuple
+from typing import Tuple, List
 
 from heuristic import Heuristic
+from candidates import neighbourhood_masks, near_mask, candidate_mask
 
 import random
 
 def get_next_state(state: GameState, action: GameAction) -> GameState:
-    if state in GameState.NEXT_STATE_MAP and action in GameState.NEXT_STATE_MAP[state]:
-        # print("hit")
-        return GameState.NEXT_STATE_MAP[state][action]
-    
+    # MCTS looks children up in its TranspositionTable before calling this
     game_inst = Game(state)
     ok = game_inst.execute_action(action)
     if not ok:
         raise ValueError("next_state: illegal action.")        
     game_inst.check(action)
     
-    next_state = game_inst.get_state()
-    GameState.NEXT_STATE_MAP.setdefault(state, dict())
-    GameState.NEXT_STATE_MAP[state][action] = next_state
-    return next_state
+    return game_inst.get_state()
 
 
 def get_terminal_value(state: GameState) -> float: 
@@ -31,8 +28,90 @@ def get_terminal_value(state: GameState) -> float:
     return state.winner * state.next_player
 
 
+class RolloutBoard:
+    # mutable board for rollouts: play/undo in place instead of building a GameState per move
+    def __init__(self, state: GameState, tracker=None, candidate_radius: int=0):
+        self.board: List[List[int]] = [list(row) for row in state.board]
+        self.stones = {BLACK: state.black, WHITE: state.white}
+        self.legal_mask = state.legal_mask
+        self.player = state.next_player
+        self.key = state.key
+        
+        self.done = state.done
+        self.winner = state.winner
+        
+        # see Heuristic.make_tracker
+        self.tracker = tracker
+        # cells near a stone (candidates.py), kept per move; None when every legal move is a candidate
+        self._neighbourhoods = neighbourhood_masks(candidate_radius) if candidate_radius > 0 else None
+        self.near = near_mask(state.black | state.white, candidate_radius) if candidate_radius > 0 else None
+        self._near_history: List[int] = []
+        
+        self._start_last_move = state.last_move
+        self._start_step = state.step
+        self._history: List[int] = []
+        
+        
+    def play(self, idx: int) -> bool:
+        player = self.player
+        bit = 1 << idx
+        stones = self.stones[player] | bit
+        self.stones[player] = stones
+        x, y = idx_to_pos(idx)
+        self.board[x][y] = player
+        self.legal_mask ^= bit
+        self.key ^= ZOBRIST_KEYS[player][idx] ^ ZOBRIST_SIDE
+        self.player = -player
+        self._history.append(idx)
+        if self.tracker is not None:
+            self.tracker.place(idx, player)
+        if self._neighbourhoods is not None:
+            self._near_history.append(self.near)
+            self.near |= self._neighbourhoods[idx]
+        
+        if has_five_at(stones, idx):
+            self.done = True
+            self.winner = player
+            self.legal_mask = 0
+        elif self.legal_mask == 0:
+            self.done = True
+        return self.done
+    
+    
+    def undo(self, n: int=1) -> None:
+        for _ in range(n):
+            idx = self._history.pop()
+            player = -self.player
+            bit = 1 << idx
+            self.stones[player] ^= bit
+            x, y = idx_to_pos(idx)
+            self.board[x][y] = EMPTY
+            self.key ^= ZOBRIST_KEYS[player][idx] ^ ZOBRIST_SIDE
+            self.player = player
+            if self.tracker is not None:
+                self.tracker.remove(idx, player)
+            if self._neighbourhoods is not None:
+                self.near = self._near_history.pop()
+            # play() is never called on a finished board
+            self.done = False
+            self.winner = EMPTY
+            self.legal_mask = FULL_MASK & ~(self.stones[BLACK] | self.stones[WHITE])
+        
+        
+    def candidate_mask(self) -> int:
+        return self.legal_mask if self.near is None else candidate_mask(self.legal_mask, self.near)
+        
+        
+    def to_state(self) -> GameState:
+        last_move = GameAction.ALL_ACTIONS[self._history[-1]] if self._history else self._start_last_move
+        return GameState(
+            self.stones[BLACK], self.stones[WHITE], self.player, last_move, 
+            self._start_step + len(self._history), self.done, self.winner, self.key, self.legal_mask
+        )
+
+
 class Rollout:
-    def __init__(self, n_rollout: int, depth: int, heuristic: Heuristic, important_pos_weight: int, other_pos_weight: int, epsilon: float):
+    def __init__(self, n_rollout: int, depth: int, heuristic: Heuristic, important_pos_weight: int, other_pos_weight: int, epsilon: float, candidate_radius: int=0):
         self.n_rollout = n_rollout
         self.depth = depth
         self.heuristic = heuristic
@@ -40,23 +119,33 @@ class Rollout:
         self.important_pos_weight = important_pos_weight
         self.other_pos_weight = other_pos_weight
         self.epsilon = epsilon
+        # moves are sampled among RolloutBoard.candidate_mask
+        self.candidate_radius = candidate_radius
+        # rollouts played and their total length, read by MCTS for its SearchStats
+        self.n_played = 0
+        self.n_plies = 0
         
         
     def estimate_value(self, state: GameState) -> float:
         cur_player = state.next_player
         total_value = 0
+        board = RolloutBoard(state, self.heuristic.make_tracker(state) if self.heuristic else None, self.candidate_radius)
         for i in range(self.n_rollout):
             # print(f"{i}/{self.n_rollout}")
-            final_state, depth = self.roll_out(state)
+            depth = self.play_out(board)
+            self.n_plies += depth
             if self.heuristic:
-                final_value, _ = self.heuristic.estimate_value(final_state)
-                if final_state.next_player == cur_player:
+                final_value = 0.0
+                if not board.done:
+                    final_value, _ = self.heuristic.evaluate_rollout(board)
+                if board.player == cur_player:
                     total_value += final_value
                 else:
                     total_value -= final_value
             else:
-                total_value = final_state.winner * cur_player
-            
+                total_value += board.winner * cur_player
+            board.undo(depth)
+        self.n_played += self.n_rollout
         
         value = total_value / self.n_rollout
         # print(value, total_value)
@@ -64,30 +153,40 @@ class Rollout:
     
     
     def roll_out(self, state: GameState) -> Tuple[GameState, int]:
-        game_inst = Game(state)
+        board = RolloutBoard(state, self.heuristic.make_tracker(state) if self.heuristic else None, self.candidate_radius)
+        depth = self.play_out(board)
+        return board.to_state(), depth
+    
+    
+    def play_out(self, board: RolloutBoard) -> int:
+        # plays up to self.depth moves on board and returns how many were played
         cur_depth = 0
-        while not state.done and cur_depth < self.depth:
-            legal_action_list = state.legal_actions
+        while not board.done and cur_depth < self.depth:
+            move_mask = board.candidate_mask()
             if self.heuristic and random.random() < self.epsilon:
-                _, important_pos_list = self.heuristic.estimate_value(state)
-                # print(len(legal_action_list), len(important_pos_list))
-                weights = []
-                for action in legal_action_list:
-                    if (action.x, action.y) in important_pos_list:
-                        weights.append(self.important_pos_weight)
-                    else:
-                        weights.append(self.other_pos_weight)
-                
-                action = random.choices(legal_action_list, weights=weights, k=1)[0]
+                _, important_mask = self.heuristic.evaluate_rollout(board)
+                idx = self._choose_weighted(move_mask, important_mask)
             else:
-                action = random.choice(legal_action_list)
-            ok = game_inst.execute_action(action)
-            if not ok:
-                return state, cur_depth
-            game_inst.check(action)
-            state = game_inst.get_state()
+                idx = nth_bit(move_mask, random.randrange(move_mask.bit_count()))
+            board.play(idx)
             cur_depth += 1
-        return state, cur_depth
+        return cur_depth
+    
+    
+    def _choose_weighted(self, move_mask: int, important_mask: int) -> int:
+        # same distribution as random.choices over the moves of move_mask with per-move weights
+        important_mask &= move_mask
+        other_mask = move_mask ^ important_mask
+        
+        important_count = important_mask.bit_count()
+        important_total = important_count * self.important_pos_weight
+        other_count = other_mask.bit_count()
+        r = random.random() * (important_total + other_count * self.other_pos_weight)
+        # r may round up to the total: without other moves it stays in the last important bucket
+        if r < important_total or other_count == 0:
+            return nth_bit(important_mask, min(int(r / self.important_pos_weight), important_count - 1))
+        n = min(int((r - important_total) / self.other_pos_weight), other_count - 1)
+        return nth_bit(other_mask, n)
     
     
 def print_matrix(matrix):
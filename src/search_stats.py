@@ -0,0 +1,112 @@
+from typing import Dict
+
+
+# phases of one simulation, timed when MCTSConfig.instrument is on
+PHASES = ["selection", "expansion", "heuristic", "rollout", "backup"]
+
+
+class SearchStats:
+    # what one MCTS.search did. The counters below the phase times are only filled by instrumented searches,
+    # everything else is collected once per search
+    def __init__(self):
+        self.elapsed: float = 0.0
+        self.n_workers: int = 1
+        # why the search stopped: "budget", "break_early", "decided", "deadline", "stored" or "done"
+        self.stop_reason: str = "budget"
+        self.n_simulations: int = 0
+        self.reused_visits: int = 0
+        self.saved_simulations: int = 0
+
+        self.eval_cache_hits: int = 0
+        self.eval_cache_misses: int = 0
+        # the transposition table took over the lookups of NEXT_STATE_MAP
+        self.transposition_hits: int = 0
+        self.transposition_misses: int = 0
+        self.n_rollouts: int = 0
+        self.rollout_plies: int = 0
+
+        self.instrumented: bool = False
+        self.phase_time: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+        self.phase_calls: Dict[str, int] = {phase: 0 for phase in PHASES}
+        self.max_depth: int = 0
+        self.total_depth: int = 0
+        self.n_expansions: int = 0
+
+
+    @staticmethod
+    def rate(hits: int, misses: int) -> float:
+        total = hits + misses
+        return hits / total if total else 0.0
+
+
+    def eval_cache_hit_rate(self) -> float:
+        return self.rate(self.eval_cache_hits, self.eval_cache_misses)
+
+
+    def transposition_hit_rate(self) -> float:
+        return self.rate(self.transposition_hits, self.transposition_misses)
+
+
+    def mean_rollout_length(self) -> float:
+        return self.rollout_plies / self.n_rollouts if self.n_rollouts else 0.0
+
+
+    def mean_depth(self) -> float:
+        return self.total_depth / self.n_simulations if self.n_simulations else 0.0
+
+
+    def simulations_per_second(self) -> float:
+        return self.n_simulations / self.elapsed if self.elapsed > 0 else 0.0
+
+
+    def add(self, other: "SearchStats") -> None:
+        # sums the counters of another search of the same root, e.g. of the workers of parallel_mcts.ParallelMCTS
+        for name in ["n_simulations", "reused_visits", "saved_simulations", "eval_cache_hits", "eval_cache_misses",
+                     "transposition_hits", "transposition_misses", "n_rollouts", "rollout_plies", "total_depth", "n_expansions"]:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for phase in PHASES:
+            self.phase_time[phase] += other.phase_time[phase]
+            self.phase_calls[phase] += other.phase_calls[phase]
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.instrumented = self.instrumented or other.instrumented
+
+
+    def to_dict(self) -> dict:
+        stats = {
+            "elapsed": self.elapsed,
+            "n_workers": self.n_workers,
+            "stop_reason": self.stop_reason,
+            "n_simulations": self.n_simulations,
+            "reused_visits": self.reused_visits,
+            "saved_simulations": self.saved_simulations,
+            "eval_cache_hit_rate": self.eval_cache_hit_rate(),
+            "transposition_hit_rate": self.transposition_hit_rate(),
+            "n_rollouts": self.n_rollouts,
+            "mean_rollout_length": self.mean_rollout_length(),
+        }
+        if self.instrumented:
+            stats.update({
+                "phase_time": dict(self.phase_time),
+                "phase_calls": dict(self.phase_calls),
+                "max_depth": self.max_depth,
+                "mean_depth": self.mean_depth(),
+                "n_expansions": self.n_expansions,
+            })
+        return stats
+
+
+    def __str__(self) -> str:
+        text = f"搜索时间: {self.elapsed:.4f}s, 模拟 {self.n_simulations} 次"
+        if self.n_workers > 1:
+            text += f" ({self.n_workers}进程)"
+        if self.stop_reason not in ["budget", "done"]:
+            text += f", 结束原因 {self.stop_reason}"
+        if self.saved_simulations:
+            text += f", 提前结束节省 {self.saved_simulations} 次"
+        if self.instrumented:
+            total = sum(self.phase_time.values())
+            phases = ", ".join(f"{phase} {self.phase_time[phase] / total:.0%}" for phase in PHASES) if total > 0 else ""
+            text += f"\n  阶段耗时: {phases}"
+            text += f"\n  最大深度 {self.max_depth}, 平均深度 {self.mean_depth():.1f}, 新建 {self.n_expansions} 个节点"
+            text += f"\n  估值缓存命中率 {self.eval_cache_hit_rate():.1%}, 置换表命中率 {self.transposition_hit_rate():.1%}, 平均展开长度 {self.mean_rollout_length():.1f}"
+        return text
@@ -1,8 +1,8 @@
 from constant import WIDTH, WIN_LEN
-from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH
+from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH, MCTS_TIME_BUDGET_MS
 
 from constant import ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
-from constant import HEURISTIC_CFG
+from constant import HEURISTIC_CFG, EVAL_STORE_PATH
 
 from mcts_config import MCTSConfig
 
@@ -16,11 +16,17 @@ from rollout import Rollout, get_next_state, get_terminal_value
 from typing import List, Optional, Dict, Tuple
 import random, math
 
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
 import time
 
 from mcts import MCTS
 
 from utils import save_dict_to_file
+from dataset import ShardWriter, exps_to_records
 
 def one_self_play():
     mcts_cfg1 = MCTSConfig(
@@ -28,7 +34,8 @@ def one_self_play():
         ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG, 
         ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON, 
         HEURISTIC_CFG,
-        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT,
+        eval_store_path=EVAL_STORE_PATH
     )
     
     mcts_cfg2 = MCTSConfig(
@@ -36,7 +43,8 @@ def one_self_play():
         ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG, 
         ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON, 
         HEURISTIC_CFG,
-        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT,
+        eval_store_path=EVAL_STORE_PATH
     )
     
     agent1 = MCTS(mcts_cfg1)
@@ -54,7 +62,8 @@ def one_self_play():
         if cur_state.done:
             break
         print(f"start search {step_idx}/{WIDTH * WIDTH}")
-        action1, visit_rate_dict1 = agent1.search(cur_state)
+        action1, visit_rate_dict1, stats1 = agent1.search(cur_state, time_budget_ms=MCTS_TIME_BUDGET_MS)
+        print(stats1)
         if action1 is not None:
             # print(f"{cur_state.next_player} choose action ({action1.x}, {action1.y})")
             ok = game.execute_action(action1)
@@ -71,7 +80,8 @@ def one_self_play():
         if cur_state.done:
             break
         print(f"start search {step_idx}/{WIDTH * WIDTH}")
-        action2, visit_rate_dict2 = agent2.search(cur_state)
+        action2, visit_rate_dict2, stats2 = agent2.search(cur_state, time_budget_ms=MCTS_TIME_BUDGET_MS)
+        print(stats2)
         if action2 is not None:
             # print(f"{cur_state.next_player} choose action ({action2.x}, {action2.y})")
             ok = game.execute_action(action2)
@@ -93,39 +103,102 @@ def one_self_play():
     # print(cur_state)
     return self_play_exp_list
 
+def exp_to_dict(exp) -> dict:
+    state, visit_rate_dict, result = exp
+    policy = [[0.0] * WIDTH for _ in range(WIDTH)]
+    for action, visit_rate in visit_rate_dict.items():
+        policy[action.x][action.y] = visit_rate
+    return {
+        "state": {
+            "board": state.board,
+            "next_player": state.next_player
+        },
+        "policy": policy,
+        "result": result
+    }
+
+
 def self_play(n_self_play):
     total_exp_list = []
     for i in range(n_self_play):
         self_play_exp_list = one_self_play()
         total_exp_list.extend(self_play_exp_list)
     
-    useful_exp_list = []
-    for exp in total_exp_list:
-        state = exp[0]
-        visit_rate_dict = exp[1]
-        result = exp[2]
-        
-        policy = [[0.0] * WIDTH for _ in range(WIDTH)]
-        for action, visit_rate in visit_rate_dict.items():
-            policy[action.x][action.y] = visit_rate
-        
-        useful_exp_list.append({
-            "state": {
-                "board": state.board,
-                "next_player": state.next_player
-            },
-            "policy": policy,
-            "result": result
-        })
-    
-    return useful_exp_list
+    return [exp_to_dict(exp) for exp in total_exp_list]
+
+
+def game_seed(seed: int, game_idx: int) -> str:
+    # one random stream per game, independent of the worker that plays it and of the other games
+    return f"{seed}:{game_idx}"
+
+
+def play_game(args: Tuple[int, int, str]):
+    # runs in a pool worker -> (game index, positions as dicts or dataset records, worker pid, seconds)
+    game_idx, seed, data_format = args
+    start = time.time()
+    random.seed(game_seed(seed, game_idx))
+    with contextlib.redirect_stdout(io.StringIO()):
+        exp_list = one_self_play()
+    if data_format == "shard":
+        records = exps_to_records(exp_list)
+    else:
+        records = [exp_to_dict(exp) for exp in exp_list]
+    return game_idx, records, os.getpid(), time.time() - start
+
+
+def next_game_index(out_dir: str) -> int:
+    # one past the highest NNNN.json game file of out_dir, 0 for a new directory
+    indices = [int(name[:-5]) for name in os.listdir(out_dir) if name.endswith(".json") and name[:-5].isdigit()] if os.path.isdir(out_dir) else []
+    return max(indices) + 1 if indices else 0
+
+
+def parallel_self_play(n_workers: int, n_games: int, out_dir: str, seed: int, first_index: Optional[int]=None, data_format: str="json") -> None:
+    # games are handed out one at a time so that no worker idles while others still have a queue,
+    # and every game is written as soon as it finishes
+    if n_workers <= 0 or n_games <= 0:
+        raise ValueError("parallel_self_play: n_workers and n_games must be positive.")
+    if data_format not in ["json", "shard"]:
+        raise ValueError(f"unknown self-play data format: {data_format}")
+    if first_index is None:
+        first_index = next_game_index(out_dir)
+    if data_format == "json":
+        existing = [i for i in range(first_index, first_index + n_games) if os.path.exists(os.path.join(out_dir, f"{i:04}.json"))]
+        if existing:
+            raise ValueError(f"parallel_self_play: {out_dir} already has game {existing[0]:04}.json, choose another first_index.")
+    os.makedirs(out_dir, exist_ok=True)
+    writer = ShardWriter(out_dir) if data_format == "shard" else None
+    start = time.time()
+    worker_games: Dict[int, int] = dict()
+    worker_seconds: Dict[int, float] = dict()
+    with multiprocessing.Pool(n_workers) as pool:
+        tasks = [(first_index + i, seed, data_format) for i in range(n_games)]
+        for n_done, (game_idx, records, pid, seconds) in enumerate(pool.imap_unordered(play_game, tasks), 1):
+            if writer is not None:
+                writer.write(records)
+            else:
+                save_dict_to_file(records, os.path.join(out_dir, f"{game_idx:04}.json"))
+            worker_games[pid] = worker_games.get(pid, 0) + 1
+            worker_seconds[pid] = worker_seconds.get(pid, 0.0) + seconds
+            print(f"self play {n_done}/{n_games}: 第 {game_idx} 局 {len(records)} 步, {seconds:.1f}s")
+    if writer is not None:
+        writer.close()
+    elapsed = time.time() - start
+    for k, pid in enumerate(sorted(worker_games)):
+        print(f"进程 {k}: {worker_games[pid]} 局, {worker_games[pid] / worker_seconds[pid] * 3600:.1f} 局/小时")
+    print(f"总计: {n_games} 局, {elapsed:.1f}s, {n_games / elapsed * 3600:.1f} 局/小时 ({n_workers}进程)")
 
 
 if __name__ == "__main__":
-    base = 20
-    self_play_count = 10
-    for i in range(self_play_count):
-        print(f"self play {i+base+1}/{self_play_count+base}")
-        result = self_play(1)
-        save_dict_to_file(result, f"storage/{(i+base):04}.json")
-        print(f"save to storage/{(i+base):04}.json")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--games", type=int, default=10)
+    # storage for json, storage/shards for shard, the directory dataset.py reads, so the manifest never sits among the game files
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    # index of the first game file, after the last game file of --out by default; existing files are never overwritten
+    parser.add_argument("--first-index", type=int, default=None)
+    # json: one file per game; shard: binary shards of dataset.py
+    parser.add_argument("--format", choices=["json", "shard"], default="json")
+    args = parser.parse_args()
+    out_dir = args.out if args.out is not None else ("storage/shards" if args.format == "shard" else "storage")
+    parallel_self_play(args.workers, args.games, out_dir, args.seed, args.first_index, args.format)
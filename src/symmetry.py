@@ -0,0 +1,67 @@
+from constant import BLACK, WHITE, FIRST_PLAYER
+from bitboard import SYMMETRIES, ZOBRIST_KEYS, ZOBRIST_SIDE, iter_bits
+
+from typing import List, Optional, Tuple
+
+
+SYMMETRY_COUNT: int = len(SYMMETRIES)
+# SYMMETRIES[INVERSE_SYMMETRIES[s]] undoes SYMMETRIES[s]
+INVERSE_SYMMETRIES: List[int] = [
+    next(t for t in range(SYMMETRY_COUNT) if all(SYMMETRIES[t][SYMMETRIES[s][idx]] == idx for idx in range(len(SYMMETRIES[s]))))
+    for s in range(SYMMETRY_COUNT)
+]
+# SYMMETRIC_ZOBRIST_KEYS[player][idx][s]: the key of a stone of player on idx in the s-th image of the board
+SYMMETRIC_ZOBRIST_KEYS = {
+    player: [tuple(ZOBRIST_KEYS[player][SYMMETRIES[s][idx]] for s in range(SYMMETRY_COUNT)) for idx in range(len(SYMMETRIES[0]))]
+    for player in [BLACK, WHITE]
+}
+
+
+def symmetric_keys(black: int, white: int, next_player: int) -> Tuple[int, ...]:
+    # zobrist keys of the 8 images of a position, keys[0] is its own key and min(keys) the canonical one
+    side = ZOBRIST_SIDE if next_player != FIRST_PLAYER else 0
+    keys = [side] * SYMMETRY_COUNT
+    for player, bits in [(BLACK, black), (WHITE, white)]:
+        for idx in iter_bits(bits):
+            for s, key in enumerate(SYMMETRIC_ZOBRIST_KEYS[player][idx]):
+                keys[s] ^= key
+    return tuple(keys)
+
+
+def child_symmetric_keys(keys: Tuple[int, ...], player: int, idx: int) -> Tuple[int, ...]:
+    # symmetric_keys after player puts a stone on idx
+    return tuple(key ^ stone_key ^ ZOBRIST_SIDE for key, stone_key in zip(keys, SYMMETRIC_ZOBRIST_KEYS[player][idx]))
+
+
+def transform_mask(mask: int, s: int) -> int:
+    symmetry = SYMMETRIES[s]
+    out = 0
+    for idx in iter_bits(mask):
+        out |= 1 << symmetry[idx]
+    return out
+
+
+def find_symmetry(keys: Tuple[int, ...], black: int, white: int, image_key: int, image_black: int, image_white: int) -> Optional[int]:
+    # s such that the s-th image of (black, white) is (image_black, image_white), the bits guard against key collisions
+    for s, key in enumerate(keys):
+        if key == image_key and transform_mask(black, s) == image_black and transform_mask(white, s) == image_white:
+            return s
+    return None
+
+
+def stabilizer(keys: Tuple[int, ...], black: int, white: int) -> List[int]:
+    # the symmetries that leave the position unchanged, always including the identity 0
+    return [s for s, key in enumerate(keys) if key == keys[0] and (s == 0 or (transform_mask(black, s) == black and transform_mask(white, s) == white))]
+
+
+def orbit_representatives(mask: int, symmetries: List[int]) -> int:
+    # one cell of mask per orbit under symmetries: the one with the smallest index
+    out = 0
+    for idx in iter_bits(mask):
+        if all(SYMMETRIES[s][idx] >= idx for s in symmetries):
+            out |= 1 << idx
+    return out
+
+
+def orbit(idx: int, symmetries: List[int]) -> List[int]:
+    return sorted({SYMMETRIES[s][idx] for s in symmetries})
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from constant import BLACK
+from game import GameAction, GameState
+from bitboard import ZOBRIST_KEYS, ZOBRIST_SIDE
+from symmetry import child_symmetric_keys, find_symmetry
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+import sys
+
+if TYPE_CHECKING:
+    from mcts_node import MCTSNode
+
+
+def child_key(state: GameState, action: GameAction) -> int:
+    # zobrist key after state.next_player plays action, without building the state
+    return state.key ^ ZOBRIST_KEYS[state.next_player][action.idx] ^ ZOBRIST_SIDE
+
+
+class TranspositionTable:
+    # zobrist key -> MCTSNode, so that move orders reaching the same position share one node
+    # replacement policy: least recently used entry first. An evicted node stays in the tree,
+    # it just stops being found by other move orders
+    def __init__(self, max_entries: int):
+        if max_entries <= 0:
+            raise ValueError("TranspositionTable: max_entries must be positive.")
+        self.max_entries = max_entries
+        self._nodes: "OrderedDict[int, MCTSNode]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key: int, black: int, white: int) -> Optional[MCTSNode]:
+        # black / white guard against key collisions
+        node = self._nodes.get(key)
+        if node is None or node.state.black != black or node.state.white != white:
+            self.misses += 1
+            return None
+        self._nodes.move_to_end(key)
+        self.hits += 1
+        return node
+
+
+    def get_child(self, state: GameState, action: GameAction) -> Optional[MCTSNode]:
+        bit = 1 << action.idx
+        if state.next_player == BLACK:
+            return self.get(child_key(state, action), state.black | bit, state.white)
+        return self.get(child_key(state, action), state.black, state.white | bit)
+
+
+    def get_symmetric(self, keys: Tuple[int, ...], black: int, white: int) -> Optional[Tuple[MCTSNode, int]]:
+        # lookup by canonical key: the node of any of the 8 images of the position, and the symmetry
+        # that maps the position onto the node's state. Only for nodes that were put with their canonical key
+        key = min(keys)
+        node = self._nodes.get(key)
+        s = None
+        if node is not None:
+            state = node.state
+            s = find_symmetry(keys, black, white, state.key, state.black, state.white)
+        if s is None:
+            self.misses += 1
+            return None
+        self._nodes.move_to_end(key)
+        self.hits += 1
+        return node, s
+
+
+    def get_symmetric_child(self, node: MCTSNode, action: GameAction) -> Tuple[Optional[MCTSNode], Tuple[int, ...]]:
+        # -> (node of any image of the child, symmetric keys of the child)
+        state = node.state
+        keys = child_symmetric_keys(node.sym_keys, state.next_player, action.idx)
+        bit = 1 << action.idx
+        if state.next_player == BLACK:
+            found = self.get_symmetric(keys, state.black | bit, state.white)
+        else:
+            found = self.get_symmetric(keys, state.black, state.white | bit)
+        return (found[0] if found is not None else None), keys
+
+
+    def put(self, node: MCTSNode) -> None:
+        # nodes with symmetric keys are stored under the canonical one
+        key = node.state.key if node.sym_keys is None else min(node.sym_keys)
+        self._nodes[key] = node
+        self._nodes.move_to_end(key)
+        if len(self._nodes) > self.max_entries:
+            self._nodes.popitem(last=False)
+            self.evictions += 1
+
+
+    def clear(self) -> None:
+        self._nodes.clear()
+
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+    def approx_bytes(self, n_samples: int=64) -> int:
+        # table slots plus node and state objects, extrapolated from the most recent entries
+        n = len(self._nodes)
+        total = sys.getsizeof(self._nodes)
+        if n == 0:
+            return total
+        sampled = 0
+        sample_bytes = 0
+        for node in reversed(self._nodes.values()):
+            state = node.state
+            sample_bytes += (
+                sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node._children)
+                + sys.getsizeof(state) + sys.getsizeof(state.__dict__)
+                + sys.getsizeof(state.black) + sys.getsizeof(state.white) + sys.getsizeof(state.key)
+            )
+            sampled += 1
+            if sampled >= n_samples:
+                break
+        return total + sample_bytes * n // sampled
+
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._nodes),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate(),
+            "approx_bytes": self.approx_bytes(),
+        }
@@ -0,0 +1,305 @@
+from constant import MCTS_VIRTUAL_LOSS
+from game import GameAction, GameState
+from bitboard import iter_bits, CELL_COUNT
+from mcts_config import MCTSConfig
+from mcts import MCTS
+from rollout import get_next_state
+from array_tree import ArrayTree
+from search_stats import SearchStats
+
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import math
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+
+# (name, dtype, fill) of the per-node arrays, widest first so that every array stays aligned
+_FIELDS = [
+    ("visit", np.int64, 0),
+    ("value_sum", np.float64, 0),
+    ("parent", np.int32, -1),
+    ("first_child", np.int32, -1),
+    ("child_count", np.int16, 0),
+    ("n_expanded", np.int16, 0),
+    ("action", np.int16, -1),
+]
+# header: allocated slots, claimed simulations
+_HEADER_SIZE = 2
+
+
+class SharedTree(ArrayTree):
+    # the ArrayTree layout in one shared memory block, without GameStates:
+    # a worker rebuilds the states on its path by replaying the actions from the root.
+    # Slots are handed out under alloc_lock, node fields are written under the stripe lock of the node
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, locks: List, alloc_lock, candidate_radius: int=0):
+        self.shm = shm
+        self._capacity = capacity
+        self.locks = locks
+        self.alloc_lock = alloc_lock
+        self.candidate_radius = candidate_radius
+        self.header = np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        offset = self.header.nbytes
+        for name, dtype, _ in _FIELDS:
+            array = np.ndarray((capacity,), dtype=dtype, buffer=shm.buf, offset=offset)
+            setattr(self, name, array)
+            offset += array.nbytes
+        self.root = 0
+
+
+    @staticmethod
+    def nbytes(capacity: int) -> int:
+        return _HEADER_SIZE * 8 + capacity * sum(np.dtype(dtype).itemsize for _, dtype, _ in _FIELDS)
+
+
+    @classmethod
+    def create(cls, capacity: int, n_locks: int=64) -> "SharedTree":
+        shm = shared_memory.SharedMemory(create=True, size=cls.nbytes(capacity))
+        locks = [multiprocessing.Lock() for _ in range(n_locks)]
+        return cls(shm, capacity, locks, multiprocessing.Lock())
+
+
+    @classmethod
+    def attach(cls, name: str, capacity: int, locks: List, alloc_lock, candidate_radius: int=0) -> "SharedTree":
+        # workers share the resource tracker of the creating process, which unlinks the block in close
+        return cls(shared_memory.SharedMemory(name=name), capacity, locks, alloc_lock, candidate_radius)
+
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+
+    def reset(self) -> None:
+        # only the root slot has to be cleared, the others are written when allocated
+        for name, _, fill in _FIELDS:
+            getattr(self, name)[0] = fill
+        self.header[0] = 1
+        self.header[1] = 0
+
+
+    def claim_simulation(self, n_simulations: int) -> bool:
+        with self.alloc_lock:
+            if self.header[1] >= n_simulations:
+                return False
+            self.header[1] += 1
+            return True
+
+
+    def _allocate_children(self, node: int, state: GameState) -> bool:
+        # called under the lock of node; False when the tree is full, node then stays a leaf
+        actions = list(iter_bits(self.move_mask(state)))
+        random.shuffle(actions)
+        count = len(actions)
+        with self.alloc_lock:
+            first = int(self.header[0])
+            if first + count > self._capacity:
+                return False
+            self.header[0] = first + count
+        self.action[first:first + count] = actions
+        self.parent[first:first + count] = node
+        self.visit[first:first + count] = 0
+        self.value_sum[first:first + count] = 0.0
+        self.first_child[first:first + count] = -1
+        self.child_count[first:first + count] = 0
+        self.n_expanded[first:first + count] = 0
+        self.child_count[node] = count
+        self.first_child[node] = first
+        return True
+
+
+    def _add_virtual_loss(self, node: int) -> None:
+        # counts as a visit that went badly for whoever chose node, so other workers look elsewhere
+        with self.locks[node % len(self.locks)]:
+            self.visit[node] += 1
+            self.value_sum[node] += MCTS_VIRTUAL_LOSS
+
+
+    def select_and_expand(self, root_state: GameState, c_uct: float) -> Tuple[List[int], GameState]:
+        node = self.root
+        state = root_state
+        path = [node]
+        self._add_virtual_loss(node)
+        while not state.done:
+            child = -1
+            with self.locks[node % len(self.locks)]:
+                if self.first_child[node] < 0 and not self._allocate_children(node, state):
+                    break
+                n_expanded = int(self.n_expanded[node])
+                if n_expanded < self.child_count[node]:
+                    child = int(self.first_child[node]) + n_expanded
+                    # the slot is published by n_expanded, so its virtual loss can be written without its own lock
+                    self.visit[child] = 1
+                    self.value_sum[child] = MCTS_VIRTUAL_LOSS
+                    self.n_expanded[node] = n_expanded + 1
+            if child >= 0:
+                path.append(child)
+                state = get_next_state(state, GameAction.ALL_ACTIONS[self.action[child]])
+                break
+            node = self.select_child(node, c_uct)
+            self._add_virtual_loss(node)
+            path.append(node)
+            state = get_next_state(state, GameAction.ALL_ACTIONS[self.action[node]])
+        return path, state
+
+
+    def backup_path(self, path: List[int], value: float) -> None:
+        # the visits were counted by the virtual loss, only the value is corrected
+        for node in reversed(path):
+            with self.locks[node % len(self.locks)]:
+                self.value_sum[node] += value - MCTS_VIRTUAL_LOSS
+            value = -value
+
+
+    def close(self) -> None:
+        # numpy views hold on to the buffer, they have to go first
+        for name, _, _ in _FIELDS:
+            setattr(self, name, None)
+        self.header = None
+        self.shm.close()
+
+
+def _worker_main(conn, mcts_cfg: MCTSConfig, seed: int, shm_name: str, capacity: int, locks: List, alloc_lock) -> None:
+    # the MCTS is only used for evaluate_leaf, so every worker has its own heuristics and caches
+    random.seed(seed)
+    agent = MCTS(mcts_cfg)
+    tree = SharedTree.attach(shm_name, capacity, locks, alloc_lock, mcts_cfg.candidate_radius)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        root_state, n_simulations, c_uct = message
+        if agent.eval_store is not None:
+            # like MCTS.search: stored evals read before the simulations, new ones written once per search
+            agent.eval_store.load()
+        n_done = 0
+        while tree.claim_simulation(n_simulations):
+            path, leaf_state = tree.select_and_expand(root_state, c_uct)
+            tree.backup_path(path, agent.evaluate_leaf(leaf_state))
+            n_done += 1
+        if agent.eval_store is not None:
+            agent.eval_store.flush()
+        conn.send(n_done)
+    if agent.eval_store is not None:
+        agent.eval_store.close()
+    tree.close()
+    conn.close()
+
+
+class TreeParallelMCTS:
+    # tree parallelism: the workers run simulations on one shared tree until the budget is used up
+    # the tree is rebuilt for every search
+    def __init__(self, mcts_cfg: MCTSConfig, n_workers: int, seed: Optional[int]=None, capacity: Optional[int]=None):
+        if n_workers <= 0:
+            raise ValueError("TreeParallelMCTS: n_workers must be positive.")
+        # SharedTree expands every candidate and selects by plain UCT
+        if mcts_cfg.widening_c > 0 or mcts_cfg.prior_weight > 0:
+            raise ValueError("TreeParallelMCTS: widening_c and prior_weight are not supported.")
+        self.n_workers = n_workers
+        self.n_simulations = mcts_cfg.simu_count_per_search
+        self.c_uct = mcts_cfg.c_uct
+        if seed is None:
+            seed = random.randrange(1 << 31)
+        if capacity is None:
+            # every simulation allocates at most one block of children
+            capacity = self.n_simulations * CELL_COUNT + 1
+        self.tree = SharedTree.create(capacity)
+        self.last_simulations_per_worker: List[int] = []
+
+        self._conns = []
+        self._processes = []
+        for i in range(n_workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(child_conn, mcts_cfg, seed + i, self.tree.shm.name, capacity, self.tree.locks, self.tree.alloc_lock),
+                daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+
+    def search(self, root_state: GameState) -> Tuple[Optional[GameAction], Dict[GameAction, float], SearchStats]:
+        start = time.perf_counter()
+        stats = SearchStats()
+        stats.n_workers = self.n_workers
+        if root_state.done:
+            stats.stop_reason = "done"
+            return None, dict(), stats
+        self.tree.reset()
+        for conn in self._conns:
+            conn.send((root_state, self.n_simulations, self.c_uct))
+        self.last_simulations_per_worker = [conn.recv() for conn in self._conns]
+        stats.n_simulations = sum(self.last_simulations_per_worker)
+
+        visit_rate_dict = self.tree.get_visit_distribution()
+        max_visit_rate = -math.inf
+        max_visit_action = None
+        for action, visit_rate in visit_rate_dict.items():
+            if max_visit_rate < visit_rate:
+                max_visit_rate = visit_rate
+                max_visit_action = action
+        stats.elapsed = time.perf_counter() - start
+        return max_visit_action, visit_rate_dict, stats
+
+
+    def close(self) -> None:
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._conns = []
+        self._processes = []
+        if self.tree is not None:
+            shm = self.tree.shm
+            self.tree.close()
+            shm.unlink()
+            self.tree = None
+
+
+    def __enter__(self) -> "TreeParallelMCTS":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    from constant import MCTS_HEURISTIC_WEIGHT, MCTS_ROLLOUT_WEIGHT, MCTS_SELECT_UCT, MCTS_SIMU_COUNT_PER_SEARCH
+    from constant import ROLLOUT_DEPTH, ROLLOUT_PER_SIMU, ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON
+    from constant import HEURISTIC_CFG
+    from game import Game
+    from mcts import print_visit_rate
+
+    mcts_cfg = MCTSConfig(
+        MCTS_SIMU_COUNT_PER_SEARCH, MCTS_SELECT_UCT,
+        ROLLOUT_PER_SIMU, ROLLOUT_DEPTH, HEURISTIC_CFG,
+        ROLLOUT_IMPORTANT_POS_WEIGHT, ROLLOUT_OTHER_POS_WEIGHT, ROLLOUT_USE_HEURISTIC_EPSILON,
+        HEURISTIC_CFG,
+        MCTS_ROLLOUT_WEIGHT, MCTS_HEURISTIC_WEIGHT
+    )
+    game = Game()
+    with TreeParallelMCTS(mcts_cfg, max(2, multiprocessing.cpu_count()), seed=0) as agent:
+        for i in range(6):
+            cur_state = game.get_state()
+            if cur_state.done:
+                break
+            action, visit_rate_dict, stats = agent.search(cur_state)
+            print(stats)
+            print_visit_rate(visit_rate_dict)
+            print(f"choose action ({action.x}, {action.y}), simulations per worker {agent.last_simulations_per_worker}")
+            game.execute_action(action)
+            game.check(action)
+    print(game.get_state())